@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import glob
+import time
+import hashlib
+import argparse
+import traceback
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from mwc_functions import transform_and_sort_dataframe, variables_by_year
+from mwc_class import getMVWs
+
+## batch runner for all countries, replaces the production loop of production.ipynb
+## countries run on a process pool, the biggest parliaments (sum of 2^n over the elections) are submitted first for a better load balance
+## every finished country writes a checkpoint (checkpoint_folder/<country>.json) --> an interrupted run resumes where it stopped
+## the checkpoints also hold the years with errors (verify_found_miw) and the crit_cases (verify_types), collected in the summary
+## as cases_to_be_looked_at and crit_cases
+## run: python batch_functions.py [files ...] --workers 4 (see --help), files are names in data/ (getMVWs reads from there)
+
+DEFAULT_SETTINGS = {'save_results': True, 'verify_mwcs': True, 'encoding': 'utf-16', 'delimiter': '\t',
+                    'find_all_weights': True, 'find_errors': False, 'results_folder': 'results'}
+
+def country_name_from_file(file_path):
+    ## same names as the notebook (file name capitalized), i.e. 'NewZealand.csv' --> 'Newzealand'
+    country_name, _ = os.path.splitext(os.path.basename(file_path))
+    return country_name.capitalize()
+
+def parliament_cost(file_path, encoding='utf-16', delimiter='\t'):
+    ## rough cost of one country: sum of 2^n over its elections, with the same encoding/delimiter fallbacks as preliminaries
+    for encoding, delimiter in ((encoding, delimiter), ('UTF-8', ';'), ('UTF-8', ',')):
+        try:
+            df = transform_and_sort_dataframe(pd.read_csv(file_path, delimiter=delimiter, encoding=encoding))
+            _, _, n_in_year = variables_by_year(df)
+            return sum(2 ** n for n in n_in_year.values())
+        except Exception:
+            continue
+    return 0 # unreadable files are scheduled last, the worker reports the error
+
+def run_fingerprint(file_path, settings):
+    ## sha256 of the csv and the settings, a checkpoint is only reused for the same input and the same settings
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode())
+    with open(file_path, 'rb') as file:
+        digest.update(file.read())
+    return digest.hexdigest()
+
+def checkpoint_file(checkpoint_folder, country):
+    return os.path.join(checkpoint_folder, f'{country}.json')
+
+def load_checkpoint(checkpoint_folder, country):
+    path = checkpoint_file(checkpoint_folder, country)
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+def write_checkpoint(checkpoint_folder, checkpoint):
+    ## written to a temporary file first, a crash while writing never leaves a broken checkpoint
+    path = checkpoint_file(checkpoint_folder, checkpoint['country'])
+    with open(path + '.tmp', 'w') as file:
+        json.dump(checkpoint, file, indent=1, default=str)
+    os.replace(path + '.tmp', path)
+
+def run_country(file_name, country, settings):
+    '''whole getMVWs pipeline of one country, returns the checkpoint dict (top level function, runs on the process pool)'''
+    start = time.time()
+    checkpoint = {'country': country, 'file': file_name, 'status': 'done', 'error_years': [], 'crit_cases': [], 'error': None}
+    try:
+        country_data = getMVWs(file_name, name=country, **settings)
+        country_data.preliminaries()
+        country_data.minimal_voting_weights_pipeline()
+        country_data.power_indices_pipeline()
+        ## as in the notebook: a year is questionable if verify_found_miw found any error
+        checkpoint['error_years'] = [year for year, errors in (country_data.errors or {}).items() if errors]
+        checkpoint['crit_cases'] = list(country_data.crit_cases or [])
+    except Exception:
+        checkpoint['status'] = 'failed'
+        checkpoint['error'] = traceback.format_exc()
+    checkpoint['seconds'] = time.time() - start
+    return checkpoint
+
+def summarize(checkpoints):
+    ## cases_to_be_looked_at: (country, years with errors), crit_cases: (country, messages), failed: (country, traceback)
+    return {'cases_to_be_looked_at': {c['country']: c['error_years'] for c in checkpoints if c['error_years']},
+            'crit_cases': {c['country']: c['crit_cases'] for c in checkpoints if c['crit_cases']},
+            'failed': {c['country']: c['error'] for c in checkpoints if c['status'] == 'failed'},
+            'seconds': {c['country']: c['seconds'] for c in checkpoints}}
+
+def run_batch(files=None, folder='data', workers=1, year_workers=1, checkpoint_folder=os.path.join('results', 'checkpoints'), resume=True, verbose=True, **settings):
+    '''main method: runs all countries, returns the summary (also written to checkpoint_folder/summary.json)'''
+    ## files: csv names in folder (default: all *.csv in folder), folder has to be 'data' for getMVWs
+    ## workers: countries at the same time, year_workers: process pool for the elections of one country (workers of getMVWs)
+    ## settings: other keyword arguments of getMVWs (i.e. store_path, cache_path), see DEFAULT_SETTINGS
+    ## resume: countries with a 'done' checkpoint of the same csv and settings are skipped, failed ones run again
+    settings = {**DEFAULT_SETTINGS, **settings, 'workers': year_workers}
+    if not os.path.exists(checkpoint_folder):
+        os.makedirs(checkpoint_folder)
+    files = [os.path.basename(file) for file in files] if files else sorted(os.path.basename(file) for file in glob.glob(os.path.join(folder, '*.csv')))
+    checkpoints = []
+    tasks = []
+    for file_name in files:
+        country = country_name_from_file(file_name)
+        fingerprint = run_fingerprint(os.path.join(folder, file_name), settings)
+        checkpoint = load_checkpoint(checkpoint_folder, country) if resume else None
+        if checkpoint is not None and checkpoint['status'] == 'done' and checkpoint.get('fingerprint') == fingerprint:
+            checkpoints.append(checkpoint)
+            continue
+        tasks.append((parliament_cost(os.path.join(folder, file_name), settings['encoding'], settings['delimiter']), file_name, country, fingerprint))
+    tasks.sort(key=lambda task: task[0], reverse=True) # biggest parliaments first
+    if verbose:
+        print(f'{len(checkpoints)} countries from checkpoints, {len(tasks)} to run')
+    start = time.time()
+
+    def finish(checkpoint, fingerprint):
+        checkpoint['fingerprint'] = fingerprint
+        write_checkpoint(checkpoint_folder, checkpoint)
+        checkpoints.append(checkpoint)
+        if verbose:
+            print(f"{checkpoint['country']} {checkpoint['status']} after {checkpoint['seconds']:.1f} seconds")
+
+    if workers is None or workers <= 1:
+        for _, file_name, country, fingerprint in tasks:
+            finish(run_country(file_name, country, settings), fingerprint)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(run_country, file_name, country, settings): fingerprint for _, file_name, country, fingerprint in tasks}
+            try:
+                for future in as_completed(futures):
+                    finish(future.result(), futures[future])
+            except KeyboardInterrupt: # finished countries are checkpointed, the next run resumes with the others
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+    summary = summarize(sorted(checkpoints, key=lambda checkpoint: checkpoint['country']))
+    with open(os.path.join(checkpoint_folder, 'summary.json'), 'w') as file:
+        json.dump(summary, file, indent=1, default=str)
+    if verbose:
+        print(f'Total time: {time.time() - start:.2f} seconds')
+    return summary
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description='runs the getMVWs pipeline for all countries in data/')
+    parser.add_argument('files', nargs='*', help='csv files in data/ (default: all)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='countries at the same time')
+    parser.add_argument('--year-workers', type=int, default=1, help='process pool for the elections of one country')
+    parser.add_argument('--checkpoint-folder', default=os.path.join('results', 'checkpoints'))
+    parser.add_argument('--no-resume', action='store_true', help='ignore existing checkpoints')
+    parser.add_argument('--results-folder', default='results')
+    parser.add_argument('--store-path', default=None, help='parquet store instead of excel workbooks')
+    parser.add_argument('--cache-path', default=None, help='sqlite file of the canonical-game cache')
+    parser.add_argument('--encoding', default='utf-16')
+    parser.add_argument('--delimiter', default='\t')
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    arguments = parse_arguments(sys.argv[1:])
+    summary = run_batch(arguments.files, workers=arguments.workers, checkpoint_folder=arguments.checkpoint_folder, resume=not arguments.no_resume,
+                        year_workers=arguments.year_workers, results_folder=arguments.results_folder, store_path=arguments.store_path,
+                        cache_path=arguments.cache_path, encoding=arguments.encoding, delimiter=arguments.delimiter)
+    print('cases_to_be_looked_at:', summary['cases_to_be_looked_at'])
+    print('crit_cases:', summary['crit_cases'])
+    print('failed:', list(summary['failed']))
@@ -0,0 +1,63 @@
+import sys
+import time
+import numpy as np
+
+import power_indice_functions
+from power_indice_functions import coals, coals_with_i, coals_with_i_vectorized, pb_and_ss_i
+
+## benchmark of the power index dp: old python double loop (coals_with_i) against coals_with_i_vectorized
+## raw seat totals are used on purpose (Q in the hundreds), that is where the loop hurts
+## run: python benchmark_power_indices.py [repetitions]
+
+def random_parliament(rng, n, total_seats):
+    ## n parties with random seats adding up to about total_seats, at least one seat each
+    shares = rng.dirichlet(np.ones(n))
+    return np.maximum(np.round(shares * total_seats), 1).astype(np.int64)
+
+def time_pb_and_ss(weights, min_cardinality, kernel):
+    ## pb_and_ss_i with the given coals_with_i kernel, returns seconds and (pb_list, ss_list)
+    original = power_indice_functions.coals_with_i_vectorized
+    power_indice_functions.coals_with_i_vectorized = kernel
+    try:
+        start = time.perf_counter()
+        result = pb_and_ss_i(weights, min_cardinality)
+        return time.perf_counter() - start, result
+    finally:
+        power_indice_functions.coals_with_i_vectorized = original
+
+def run_benchmark(repetitions=3, cases=((5, 100), (8, 300), (10, 600), (15, 600), (20, 1000)), seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for n, total_seats in cases:
+        for _ in range(repetitions):
+            weights = random_parliament(rng, n, total_seats)
+            old_seconds, (old_pb, old_ss) = time_pb_and_ss(weights, 1, coals_with_i)
+            new_seconds, (new_pb, new_ss) = time_pb_and_ss(weights, 1, coals_with_i_vectorized)
+            same = old_pb == new_pb and old_ss == new_ss # exact, not allclose
+            rows.append((n, int(weights.sum()), old_seconds, new_seconds, same))
+    print(f"{'n':>3} {'Q':>6} {'loop [s]':>10} {'numpy [s]':>10} {'speed-up':>9} {'same':>5}")
+    for n, Q, old_seconds, new_seconds, same in rows:
+        print(f"{n:>3} {Q:>6} {old_seconds:>10.4f} {new_seconds:>10.4f} {old_seconds / new_seconds:>9.1f} {str(same):>5}")
+    return rows
+
+def check_kernels(samples=500, seed=1):
+    ## compares the M_only_i arrays of both kernels on random small games, incl. zero weights and small chunks
+    rng = np.random.default_rng(seed)
+    for _ in range(samples):
+        n = int(rng.integers(1, 9))
+        W = rng.integers(0, rng.choice([3, 20, 200]), n)
+        Q = int(W.sum())
+        if Q == 0:
+            continue
+        q = Q // 2 + 1
+        M = coals(W, Q, q, n)
+        for i in range(n):
+            old = coals_with_i(int(W[i]), Q, q, n, M, i)
+            new = coals_with_i_vectorized(int(W[i]), Q, q, n, M, i, chunk_rows=int(rng.integers(1, 50)))
+            if not np.array_equal(old, new):
+                return False
+    return True
+
+if __name__ == '__main__':
+    print('kernels identical:', check_kernels())
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
@@ -0,0 +1,89 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+import numpy as np
+
+## persistent cache of minimal voting weights and power indices, keyed by a canonical form of the weighted game
+## parliaments of different countries/years often are the same game once the parties are sorted by seats,
+## e.g. (3,2,2) and (1,1,1) both are "any two out of three" --> only the first one needs a milp
+## stored in a single sqlite file, no extra module needed
+
+def canonical_game(min_win_masks, seats, variant=''):
+    '''canonical key of the game of one year'''
+    ## parties are sorted by seats (largest first), a strictly more desirable party always has strictly more seats
+    ## parties with equal seats are symmetric, so their order does not change the set of mwc
+    ## --> the sorted set of mwc in this order is the same for all parliaments describing the same game
+    ## variant: string for settings changing the stored results (i.e. 'neighbours' or 'nogood'), part of the key
+    ## returns key (sha256 hex) and order, order[k] is the party index at canonical position k
+    order = np.argsort(-np.asarray(seats), kind='stable')
+    position = np.empty(len(order), dtype=np.int64)
+    position[order] = np.arange(len(order)) # canonical position of every party
+    canonical_masks = np.zeros(len(min_win_masks), dtype=np.int64)
+    for i in range(len(order)):
+        canonical_masks |= ((np.asarray(min_win_masks) >> i) & 1) << position[i]
+    key_string = f"{len(order)}|{variant}|" + ','.join(map(str, np.sort(canonical_masks)))
+    return hashlib.sha256(key_string.encode()).hexdigest(), order
+
+def get_all_canonical_games(min_win_masks, seats_in_year, variant=''):
+    ## simple loop again, returns dict with (year, (key, order))
+    return {year: canonical_game(masks, seats_in_year[year], variant) for year, masks in min_win_masks.items()}
+
+def to_canonical(values, order):
+    ## party order --> canonical order
+    return [values[i] for i in order]
+
+def from_canonical(values, order):
+    ## canonical order --> party order
+    result = [None] * len(order)
+    for k, i in enumerate(order):
+        result[i] = values[k]
+    return result
+
+def open_game_cache(cache_path):
+    ## opens (and creates if necessary) the sqlite file with the games table
+    folder = os.path.dirname(cache_path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    conn = sqlite3.connect(cache_path)
+    conn.execute('''CREATE TABLE IF NOT EXISTS games (
+                        key TEXT PRIMARY KEY, n INTEGER, weights TEXT, alternatives TEXT, power TEXT,
+                        size INTEGER DEFAULT 0, created REAL, last_used REAL, hits INTEGER DEFAULT 0)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS games_last_used ON games (last_used)')
+    return conn
+
+def cache_lookup(conn, key):
+    ## returns dict with 'weights', 'alternatives', 'power' (all in canonical order, None if not stored yet) or None if the game is unknown
+    row = conn.execute('SELECT weights, alternatives, power FROM games WHERE key = ?', (key,)).fetchone()
+    if row is None:
+        return None
+    conn.execute('UPDATE games SET last_used = ?, hits = hits + 1 WHERE key = ?', (time.time(), key))
+    conn.commit()
+    return {name: json.loads(value) if value is not None else None for name, value in zip(('weights', 'alternatives', 'power'), row)}
+
+def cache_store(conn, key, n, weights=None, alternatives=None, power=None):
+    ## inserts a game or fills in the given fields of a known game, all values in canonical order
+    ## weights: list, alternatives: list of lists, power: dict of lists (i.e. {'pb': [...], 'ss': [...]})
+    now = time.time()
+    conn.execute('INSERT OR IGNORE INTO games (key, n, created, last_used) VALUES (?, ?, ?, ?)', (key, n, now, now))
+    for name, value in (('weights', weights), ('alternatives', alternatives), ('power', power)):
+        if value is not None:
+            conn.execute(f'UPDATE games SET {name} = ?, last_used = ? WHERE key = ?', (json.dumps(value), now, key))
+    conn.execute('''UPDATE games SET size = LENGTH(COALESCE(weights, '')) + LENGTH(COALESCE(alternatives, '')) + LENGTH(COALESCE(power, ''))
+                    WHERE key = ?''', (key,))
+    conn.commit()
+
+def evict(conn, max_entries=100000, max_bytes=None):
+    ## drops the least recently used games until at most max_entries games (and max_bytes of stored json) are left
+    count = conn.execute('SELECT COUNT(*) FROM games').fetchone()[0]
+    if count > max_entries:
+        conn.execute('DELETE FROM games WHERE key IN (SELECT key FROM games ORDER BY last_used ASC LIMIT ?)', (count - max_entries,))
+    if max_bytes is not None:
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM games').fetchone()[0]
+        while total > max_bytes:
+            key, size = conn.execute('SELECT key, size FROM games ORDER BY last_used ASC LIMIT 1').fetchone()
+            conn.execute('DELETE FROM games WHERE key = ?', (key,))
+            total -= size
+    conn.commit()
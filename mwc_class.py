@@ -13,10 +13,13 @@ from math import factorial
 from mwc_functions import * 
 from optimization_functions import *
 from power_indice_functions import * 
+from cache_functions import *
+from simulation_functions import simulate_parliament
+from store_functions import *
 
 
 class getMVWs:    
-    def __init__(self, csv_file_path,name='country', encoding='utf-16', delimiter='\t',save_results=False,find_all_weights=True,verify_mwcs=False,find_errors = False ,results_folder='results'):
+    def __init__(self, csv_file_path,name='country', encoding='utf-16', delimiter='\t',save_results=False,find_all_weights=True,verify_mwcs=False,find_errors = False ,results_folder='results',full_table_max_n=20,lazy_constraints=False,weight_enumeration='neighbours',max_representations=1000,enumeration_time_budget=60,workers=1,cache_path=None,cache_max_entries=100000,cache_max_bytes=None,symmetry_reduction=False,warm_start=False,compare_cold=False,quota=0.5,store_path=None,excel_export=None,incremental=False):
         self.name = name
         self.csv_file_path = csv_file_path
         self.saveresults = save_results
@@ -26,36 +29,75 @@ class getMVWs:
         self.delimiter = delimiter
         self.verify = verify_mwcs
         self.find_errors = find_errors
+        self.full_table_max_n = full_table_max_n # years with more parties skip the 2^n coalition tables
+        self.lazy_constraints = lazy_constraints # cutting-plane mode instead of all |W|*|L| constraints
+        if weight_enumeration not in ('neighbours','nogood'): 
+            raise ValueError(f"unknown weight_enumeration {weight_enumeration}, use 'neighbours' or 'nogood'")
+        self.weight_enumeration = weight_enumeration # 'neighbours': +1/-1 swaps around the optimum, 'nogood': all optimal weights via no-good cuts
+        self.max_representations = max_representations
+        self.enumeration_time_budget = enumeration_time_budget # seconds per year
+        self.workers = workers # >1 solves the years on a process pool
+        self.cache_path = cache_path # sqlite file of the canonical-game cache, None switches the cache off
+        self.cache_max_entries = cache_max_entries
+        self.cache_max_bytes = cache_max_bytes
+        self.symmetry_reduction = symmetry_reduction # same-type parties share one variable in the milp
+        self.warm_start = warm_start # heuristic incumbent (scaled seats, previous election, local search) before the milp
+        self.compare_cold = compare_cold # also times the milp without incumbent for the heuristic report
+        self.quota = quota # share of all seats a coalition has to exceed (0.5, 0.6, '2/3', ...), see quota_batch for several quotas
+        self.store_path = store_path # root of the parquet store (store_functions), results are saved there if given
+        self.excel_export = excel_export if excel_export is not None else store_path is None # excel workbooks only as optional last step next to the store
+        self.incremental = incremental # only elections without a completed result of the same content hash are computed, needs store_path
+        self.streaming = False # True while stream_years runs, every save then only holds one year
         # Ini prelims
         self.dataframe = None
         self.transformed_dataframe = None
         self.parties_in_year = None
         self.totalseats_in_year = None
-        self.coalition_dict = None
-        self.winning_coal_dict = None
+        self.seats_in_year = None
+        self.coalition_seats = None # compact form: (year, seat array over all bitmasks)
+        self.winning_coalitions = None
+        self.min_win_masks = None
+        self.max_lose_masks = None
         self.minimal_winning_coalitions = None
         self.same_type_dict = None
         self.maximal_losing_coalitions = None
         self.unique_tying_coalitions = None
         self.n_in_year = None
         self.time = None
+        self.year_hashes = None # (year, content hash of its parties and seats)
+        self.changed_years = None # years computed in this run (incremental mode)
         #Ini pipeline
         self.all_relevant_coals = None
+        self.all_arrays = None # (winning_array, losing_array) incidence matrices per year
         self.all_dfs = None
+        self.all_type_classes = None
         self.all_constraints = None
         self.all_lin_cons = None
         self.all_min_weights = None
+        self.lazy_stats = None
         self.optimal_seats = None
         self.alternative_weights=None
+        self.enumeration_stats=None
+        self.heuristic_stats = None
         self.bools = None
         self.errors = None
         self.crit_cases = None
+        self.game_keys = None
+        self.cache_stats = None
         #Ini power
         self.power_indices = None 
+        self.power_indices_long = None # one row per year, alternative representation and party
+        #Ini simulation
+        self.simulations = {} # (year, frequency tables of simulate_parliament)
 
     ######## Main Methods #############
 
     def preliminaries(self):
+        self.read_data()
+        return self.combinatorics()
+
+    def read_data(self):
+        #csv --> transformed dataframe and the per-year dicts, tries the other encoding/delimiters if the first one fails
         try:
             self.read_and_transform_data()
             self.get_variables()
@@ -69,7 +111,11 @@ class getMVWs:
                 self.delimiter=','
                 self.read_and_transform_data()
                 self.get_variables()                
-                                                   
+        if self.incremental: 
+            self.select_changed_years()
+
+    def combinatorics(self):
+        #all coalition steps of preliminaries on the current per-year dicts
         self.generate_coalition_combinatorics()
         self.identify_winning_coalitions()
         self.find_minimal_winning_coalitions()
@@ -86,24 +132,32 @@ class getMVWs:
                 "parties_in_year": self.parties_in_year,
                 "n_in_year": self.n_in_year,
                 "totalseats_in_year": self.totalseats_in_year,
-                "coalition_dict": self.coalition_dict,
-                "winning_coal_dict": self.winning_coal_dict,
+                "coalition_seats": self.coalition_seats,
+                "winning_coalitions": self.winning_coalitions,
                 "minimal_winning_coalitions": self.minimal_winning_coalitions,
                 "maximal_losing_coalitions": self.maximal_losing_coalitions,
                 "unique_tying_coalitions": self.unique_tying_coalitions
             }
             
     def minimal_voting_weights_pipeline(self):
-        self.get_all_dfs()
-        self.Find_all_contraints()
-        self.Find_all_lin_cons()
-        self.Find_all_min_weights()
+        self.get_all_arrays()
+        if self.cache_path is not None: 
+            self.solve_years_cached()
+        elif self.workers > 1 or self.symmetry_reduction or self.warm_start or not self.simple_majority(): 
+            self.solve_years_parallel()
+        else: 
+            if self.lazy_constraints: 
+                self.Find_all_min_weights_lazy()
+            else: 
+                self.Find_all_contraints()
+                self.Find_all_lin_cons()
+                self.Find_all_min_weights()
+            self.all_alt_weights()
         self.All_the_optimal_seats()
         if self.verify: 
             self.verify_found_miw()
                 #print(self.bools)
                 #print(self.errors)           
-        self.all_alt_weights()
         self.alt_weigths_withnames()
         self.verify_types()
         
@@ -112,27 +166,101 @@ class getMVWs:
             return "Pipeline completed successfully."
         else:
             print(self.crit_cases)
-            return {"Dataframes":self.all_dfs,
+            return {"Incidence Arrays":self.all_arrays,
                 "Constraints":self.all_constraints,
                 "Linear Constraints": self.all_lin_cons,
                 "Minimal Integer Weights" : self.all_min_weights,
+                "Lazy Constraint Stats": self.lazy_stats,
+                "Heuristic Stats": self.heuristic_stats,
                 "Optimal Seats": self.optimal_seats
             }
 
     def power_indices_pipeline(self): 
-        self.all_power_indices()
+        if self.cache_path is not None: 
+            self.all_power_indices_cached()
+        else: 
+            self.all_power_indices()
+        if self.incremental: 
+            self.merge_stored_years()
         if self.saveresults: 
             self.save_power_indices()
+            if self.incremental: 
+                self.mark_years_completed()
             return "Power Indices successfully saved"
         else: 
             return self.power_indices
         
 
+    ######## Streaming Mode #############
+    #one year at a time: combinatorics, weights and power indices of a year run end to end, are saved and its intermediates are dropped
+    #--> peak memory is that of the largest single parliament instead of the sum over all years, finished years are already in the store
+
+    def stream_years(self): 
+        '''generator over the years, yields (year, dict with the results of the year)'''
+        #saving goes to the store only (one partition per year), the excel workbooks would be rewritten with every year
+        #incremental: only the changed years run and the manifest is updated after every year --> an interrupted stream resumes with the next year
+        #after the last year optimal_seats, power_indices, errors and crit_cases hold all years (small, n values per year)
+        if self.saveresults and self.store_path is None: 
+            raise ValueError("streaming saves every year to the store, set store_path (or save_results=False)")
+        self.read_data()
+        all_years = {name:getattr(self,name) for name in self.YEAR_DICTS}
+        incremental,excel_export,changed = self.incremental,self.excel_export,self.changed_years
+        if self.saveresults and not incremental: # once for the whole stream, every iteration only saves its own year
+            self.drop_stale_elections()
+        self.incremental,self.excel_export,self.streaming = False,False,True # every iteration is a normal run on a one-year parliament
+        optimal_seats,power_indices,errors,crit_cases = {},{},{},[]
+        try: 
+            for year in list(all_years['parties_in_year']): 
+                for name,values in all_years.items(): 
+                    setattr(self,name,{year:values[year]})
+                self.combinatorics()
+                self.minimal_voting_weights_pipeline()
+                self.power_indices_pipeline()
+                if incremental and self.saveresults: 
+                    self.changed_years = [year]
+                    self.mark_years_completed()
+                result = {"Optimal Seats":dict(self.optimal_seats),"Power Indices":self.power_indices[year],
+                          "Errors":(self.errors or {}).get(year),"Critical Cases":list(self.crit_cases or [])}
+                optimal_seats.update(result["Optimal Seats"])
+                power_indices[year] = result["Power Indices"]
+                errors[year] = result["Errors"]
+                crit_cases.extend(result["Critical Cases"])
+                self.drop_year_intermediates()
+                yield year,result
+        finally: 
+            self.incremental,self.excel_export,self.changed_years,self.streaming = incremental,excel_export,changed,False
+            for name,values in all_years.items(): 
+                setattr(self,name,values)
+            self.optimal_seats,self.power_indices,self.errors,self.crit_cases = optimal_seats,power_indices,errors,crit_cases
+        if incremental: 
+            self.merge_stored_years()
+
+    def streaming_pipeline(self): 
+        #whole country in streaming mode, same return values as the main methods
+        for year,result in self.stream_years(): 
+            if self.find_errors: 
+                print(f'{year} done, {len(result["Power Indices"])} parties')
+        if self.saveresults: 
+            return "Streaming completed successfully."
+        return {"Optimal Seats":self.optimal_seats,"Power Indices":self.power_indices,"Critical Cases":self.crit_cases}
+
+    YEAR_DICTS = ('parties_in_year','totalseats_in_year','n_in_year','seats_in_year')
+    YEAR_INTERMEDIATES = ('coalition_seats','winning_coalitions','min_win_masks','max_lose_masks','minimal_winning_coalitions','same_type_dict',
+                          'maximal_losing_coalitions','unique_tying_coalitions','all_relevant_coals','all_arrays','all_dfs','all_type_classes',
+                          'all_constraints','all_lin_cons','all_min_weights','lazy_stats','alternative_weights','enumeration_stats','heuristic_stats',
+                          'bools','errors','crit_cases','game_keys','cache_stats','power_indices_long')
+
+    def drop_year_intermediates(self): 
+        for name in self.YEAR_INTERMEDIATES: 
+            setattr(self,name,None)
+
 ###################### Saving Functions ############### 
     def save_prelims(self):
         """requires XlsxWriter Module"""
         """install by: pip install xlsxwriter """
-        if self.saveresults:
+        if self.saveresults and self.store_path is not None: 
+            self.store_prelims()
+        if self.saveresults and self.excel_export and not self.incremental: # incremental: the coalitions of the unchanged years are only in the store
             # Creates folder if necessary
             if not os.path.exists(self.results_folder):
                 os.makedirs(self.results_folder)
@@ -149,8 +277,9 @@ class getMVWs:
                 self._save_dict_to_excel_sheet(self.parties_in_year, 'Parties per Year', writer)
                 self._save_dict_to_excel_sheet(self.n_in_year, 'n per Year', writer)
                 self._save_dict_to_excel_sheet(self.totalseats_in_year, 'Total Seats per Year', writer)
-                self._save_dict_to_excel_sheet(self.coalition_dict, 'Coalitions', writer)
-                self._save_dict_to_excel_sheet(self.winning_coal_dict, 'Winning Coalitions', writer)
+                # names of all 2^n coals only get rebuilt here
+                self._save_dict_to_excel_sheet(bitmask_to_coal_dict(self.coalition_seats, self.parties_in_year), 'Coalitions', writer)
+                self._save_dict_to_excel_sheet(bitmask_to_coal_dict(self.winning_coalitions, self.parties_in_year), 'Winning Coalitions', writer)
                 self._save_dict_to_excel_sheet(self.minimal_winning_coalitions, 'Minimal Winning Coalitions', writer)
                 self._save_dict_to_excel_sheet(self.same_type_dict, 'Same Types', writer)
                 self._save_dict_to_excel_sheet(self.maximal_losing_coalitions, 'Maximal Losing Coalitions', writer)
@@ -184,21 +313,30 @@ class getMVWs:
     def save_pipeline(self):
         """requires XlsxWriter Module"""
         """install by: pip install xlsxwriter """
-        if self.saveresults:
-            # Creates folder if necessary
-            if not os.path.exists(self.results_folder):
-                os.makedirs(self.results_folder)
+        if self.saveresults and self.store_path is not None: 
+            self.store_pipeline()
+        if self.saveresults and self.excel_export and not self.incremental: # incremental: written by save_power_indices after merge_stored_years
+            self.save_minimal_seats_excel()
 
-            # Prepare the path for the Excel file
-            output_file = os.path.join(self.results_folder, f'minimal_seats-{self.name}.xlsx')
+    def save_minimal_seats_excel(self): 
+        # Creates folder if necessary
+        if not os.path.exists(self.results_folder):
+            os.makedirs(self.results_folder)
 
-            # somehow this works.... creates the excel file
-            with pd.ExcelWriter(output_file, engine='xlsxwriter') as writer:
-                # save the dict
-                self._save_dict_to_excel_sheet(self.optimal_seats, 'Minimal Seats Per Party', writer)
+        # Prepare the path for the Excel file
+        output_file = os.path.join(self.results_folder, f'minimal_seats-{self.name}.xlsx')
+
+        # somehow this works.... creates the excel file
+        with pd.ExcelWriter(output_file, engine='xlsxwriter') as writer:
+            # save the dict
+            self._save_dict_to_excel_sheet(self.optimal_seats, 'Minimal Seats Per Party', writer)
 
     def save_power_indices(self): 
-        if self.saveresults:
+        if self.saveresults and self.store_path is not None: 
+            self.store_power_indices()
+        if self.saveresults and self.excel_export:
+            if self.incremental: # after merge_stored_years, optimal_seats and power_indices hold all years
+                self.save_minimal_seats_excel()
             if not os.path.exists(self.results_folder):
                 os.makedirs(self.results_folder)
 
@@ -207,7 +345,108 @@ class getMVWs:
             with pd.ExcelWriter(output_file, engine='xlsxwriter') as writer:
                 for year,df in self.power_indices.items():
                     df.to_excel(writer, sheet_name=f'{year}', index=False)
+                if self.power_indices_long is not None and not self.incremental: # incremental: only the computed years
+                    self.power_indices_long.to_excel(writer, sheet_name='all representations', index=False)
             
+    def store_prelims(self): 
+        """requires pyarrow, install by: pip install pyarrow"""
+        if not self.incremental and not self.streaming: # full save: elections which are not in the data anymore leave the store
+            self.drop_stale_elections()
+        write_table(self.store_path,'parties',parties_table(self.name,self.parties_in_year,self.seats_in_year))
+        write_table(self.store_path,'coalitions',coalitions_table(self.name,self.coalition_seats,self.winning_coalitions))
+        write_table(self.store_path,'minimal_winning',masks_table(self.name,self.min_win_masks,self.parties_in_year))
+        write_table(self.store_path,'maximal_losing',masks_table(self.name,self.max_lose_masks,self.parties_in_year))
+    def store_pipeline(self): 
+        write_table(self.store_path,'weights',weights_table(self.name,self.alternative_weights,self.parties_in_year))
+    def store_power_indices(self): 
+        if self.power_indices_long is not None and not self.power_indices_long.empty: 
+            write_table(self.store_path,'power_indices',power_indices_table(self.name,self.power_indices_long))
+    def drop_stale_elections(self): 
+        #partitions of this country whose election is not in parties_in_year (write_table only replaces the partitions it writes)
+        current = {normalize_election_date(year) for year in self.parties_in_year}
+        delete_elections(self.store_path,self.name,[election for election in stored_elections(self.store_path,self.name) if election not in current])
+    def read_results(self,table,**filters): 
+        #reads one store table of this country, i.e. read_results('weights',election='1994-10')
+        return read_store(self.store_path,table,[('country','=',self.name)]+[(column,'=',value) for column,value in filters.items()])
+            
+
+    #incremental wrapper, results of unchanged elections come from the store
+    def result_variant(self): 
+        #settings which change the stored results, part of the year hashes
+        return self.cache_variant() + f'|{self.full_table_max_n}' # cache_variant already holds max_representations and enumeration_time_budget
+    def select_changed_years(self): 
+        #keeps only the years without a completed result of the same hash in the per-year dicts, so all later steps only see those
+        #elections which are not in the data anymore are dropped from the store
+        if self.store_path is None: 
+            raise ValueError("incremental mode needs a store_path")
+        self.year_hashes = year_hashes(self.transformed_dataframe,self.result_variant())
+        manifest = load_year_manifest(self.store_path,self.name)
+        self.changed_years,removed = changed_years(self.year_hashes,manifest)
+        if removed and self.saveresults: 
+            delete_elections(self.store_path,self.name,removed)
+            save_year_manifest(self.store_path,self.name,{election:entry for election,entry in manifest.items() if election not in removed})
+        self.parties_in_year = {year:self.parties_in_year[year] for year in self.changed_years}
+        self.totalseats_in_year = {year:self.totalseats_in_year[year] for year in self.changed_years}
+        self.n_in_year = {year:self.n_in_year[year] for year in self.changed_years}
+        self.seats_in_year = {year:self.seats_in_year[year] for year in self.changed_years}
+        if self.find_errors: 
+            print(f'incremental: {len(self.changed_years)} of {len(self.year_hashes)} years to compute')
+    def mark_years_completed(self): 
+        #called once the results of the changed years are in the store
+        #errors and crit_cases of every year go into the manifest, merge_stored_years restores them for the unchanged years
+        checks = {year:{'errors':None if self.errors is None or year not in self.errors else [[coal,value,mw_value] for (_,coal),(value,mw_value) in self.errors[year].items()],
+                        'crit_cases':self.year_crit_cases(year)} for year in self.changed_years}
+        manifest = load_year_manifest(self.store_path,self.name)
+        save_year_manifest(self.store_path,self.name,mark_completed(manifest,self.year_hashes,self.changed_years,checks))
+    def year_crit_cases(self,year): 
+        #messages of check_type_consistency start with 'For {year},'
+        return [case for case in self.crit_cases or [] if case.startswith(f'For {year},')]
+    def merge_stored_years(self): 
+        #adds the unchanged years from the store to the per-year dicts, optimal_seats, alternative_weights and power_indices (years sorted again)
+        #errors and crit_cases of the unchanged years come from the manifest
+        manifest = load_year_manifest(self.store_path,self.name)
+        stored = {entry['year']:election for election,entry in manifest.items() 
+                  if entry['year'] in self.year_hashes and entry['year'] not in self.changed_years}
+        if not stored: 
+            return
+        elections = list(stored.values())
+        filters = [('country','=',self.name),('election','in',elections)]
+        parties = read_store(self.store_path,'parties',filters).sort_values(['election','party_index'])
+        weights = read_store(self.store_path,'weights',filters).sort_values(['election','representation','party_index'])
+        power = read_store(self.store_path,'power_indices',filters+[('representation','=',0)])
+        year_of = {election:year for year,election in stored.items()}
+        self.optimal_seats = dict(self.optimal_seats or {})
+        self.alternative_weights = dict(self.alternative_weights or {})
+        self.power_indices = dict(self.power_indices or {})
+        crit_cases = {year:self.year_crit_cases(year) for year in self.changed_years}
+        for election,df in parties.groupby('election'): 
+            year = year_of[election]
+            self.parties_in_year[year] = df['party'].tolist()
+            self.seats_in_year[year] = df['seats'].to_numpy()
+            self.n_in_year[year] = len(df)
+            self.totalseats_in_year[year] = int(df['seats'].sum())
+            year_weights = weights[weights['election']==election].pivot(index='party',columns='representation',values='weight').loc[self.parties_in_year[year]]
+            for party,row in year_weights.iterrows(): 
+                self.optimal_seats[(year,party)] = tuple(row.tolist())
+            representations = [year_weights[representation].to_numpy(dtype=float) for representation in year_weights.columns]
+            # same shape as all_alt_weights: the plain weight array for games with <=8 players in neighbours mode, otherwise the list
+            self.alternative_weights[year] = representations[0] if self.weight_enumeration=='neighbours' and len(representations[0])<=8 else representations
+            entry = manifest[election]
+            if entry.get('errors') is not None: 
+                self.errors = dict(self.errors or {})
+                self.errors[year] = {(year,coal):(value,mw_value) for coal,value,mw_value in entry['errors']}
+            crit_cases[year] = entry.get('crit_cases',[])
+            mean_weights = year_weights.mean(axis=1) # Minimal-Sum of get_power_indices_batched: mean over the representations
+            year_power = power[power['election']==election].set_index('party').loc[self.parties_in_year[year]]
+            self.power_indices[year] = pd.DataFrame({'Party':self.parties_in_year[year],'Penrose-Banzhaf':year_power['penrose_banzhaf'].to_numpy(),
+                                                     'Shapely-Shubik':year_power['shapley_shubik'].to_numpy(),'Minimal-Sum':(mean_weights/mean_weights.sum()).to_numpy()})
+        for name in ('parties_in_year','seats_in_year','n_in_year','totalseats_in_year','alternative_weights','power_indices'): 
+            setattr(self,name,dict(sorted(getattr(self,name).items())))
+        if self.errors is not None: 
+            self.errors = dict(sorted(self.errors.items()))
+        self.crit_cases = [case for year in sorted(crit_cases) for case in crit_cases[year]]
+        self.optimal_seats = dict(sorted(self.optimal_seats.items(),key=lambda item: item[0][0]))
+
     ###################### Namespace wrapper for imported funtions #################
 
     #prelim wrapper
@@ -216,40 +455,216 @@ class getMVWs:
         self.transformed_dataframe = transform_and_sort_dataframe(self.dataframe)
     def get_variables(self):
         self.parties_in_year, self.totalseats_in_year, self.n_in_year = variables_by_year(self.transformed_dataframe)
+        self.seats_in_year = seats_by_year(self.transformed_dataframe, self.parties_in_year)
     def generate_coalition_combinatorics(self):
-        self.coalition_dict = coalition_combinatorics_generator(self.transformed_dataframe, self.parties_in_year)
+        self.coalition_seats = coalition_bitmask_generator(self.seats_in_year,self.full_table_max_n)
     def identify_winning_coalitions(self):
-        self.winning_coal_dict = win_coals(self.coalition_dict, self.totalseats_in_year)
+        self.winning_coalitions = win_coals_bitmask(self.coalition_seats, self.totalseats_in_year,self.quota)
     def find_minimal_winning_coalitions(self):
-        self.minimal_winning_coalitions = min_winning_coals(self.winning_coal_dict)
+        self.min_win_masks = min_winning_dfs(self.seats_in_year,self.totalseats_in_year,self.quota)
+        self.minimal_winning_coalitions = masks_to_coal_dict(self.min_win_masks, self.parties_in_year, 1)
     def find_sametypes(self): 
-        self.same_type_dict=party_types(self.minimal_winning_coalitions,self.coalition_dict)
+        self.same_type_dict=party_types_bitmask(self.min_win_masks,self.seats_in_year,self.parties_in_year)
     def find_maximal_losing_coalitions(self):
-        self.maximal_losing_coalitions = max_loosing_coals(self.winning_coal_dict, self.parties_in_year)
+        self.max_lose_masks = max_losing_dfs(self.seats_in_year,self.totalseats_in_year,self.quota)
+        self.maximal_losing_coalitions = masks_to_coal_dict(self.max_lose_masks, self.parties_in_year, 0)
     def find_unique_tying_coalitions(self):
-        self.unique_tying_coalitions = unique_tying_coals(self.coalition_dict, self.totalseats_in_year,self.parties_in_year)
+        #ties with the complement only exist for the simple majority
+        self.unique_tying_coalitions = unique_tying_dp(self.seats_in_year, self.totalseats_in_year,self.parties_in_year) if self.simple_majority() else {}
 
     #pipeline wrapper   
+    def get_all_arrays(self): 
+        self.all_arrays = create_all_year_arrays(self.min_win_masks,self.max_lose_masks,self.n_in_year)
     def get_all_dfs(self): 
-        self.all_relevant_coals = combine_dicts(self.minimal_winning_coalitions,self.maximal_losing_coalitions)
-        self.all_dfs = create_all_year_dfs(self.all_relevant_coals,self.parties_in_year)
+        #labelled dataframe view of self.all_arrays, only on demand
+        self.all_dfs = {}
+        for year,(winning_array,losing_array) in self.all_arrays.items():
+            parties = self.parties_in_year[year]
+            win_names = [mask_to_coal(mask,parties) for mask in self.min_win_masks[year]]
+            lose_names = [mask_to_coal(mask,parties) for mask in self.max_lose_masks[year]]
+            self.all_dfs[year] = incidence_to_df(winning_array,losing_array,parties,win_names,lose_names)
+        return self.all_dfs
     def Find_all_contraints(self): 
-        self.all_constraints = get_all_constrains(self.all_dfs,self.find_errors)       
+        self.all_constraints = get_all_constrains(self.all_arrays,self.parties_in_year,self.find_errors)       
     def Find_all_lin_cons(self): 
         self.all_lin_cons = get_all_lin_cons(self.all_constraints)
     def Find_all_min_weights(self): 
         self.all_min_weights = get_all_min_vote_weights(self.all_lin_cons,self.n_in_year) 
+    def Find_all_min_weights_lazy(self): 
+        #all_constraints only holds the active rows in this mode
+        self.all_min_weights,self.all_constraints,self.lazy_stats = get_all_min_vote_weights_lazy(self.all_arrays,self.find_errors)
+    def solve_options(self): 
+        #pipeline settings passed to solve_year
+        return {'lazy_constraints':self.lazy_constraints,'weight_enumeration':self.weight_enumeration,'max_representations':self.max_representations,
+                'enumeration_time_budget':self.enumeration_time_budget,'find_errors':self.find_errors,'warm_start':self.warm_start,'compare_cold':self.compare_cold,'quota':self.quota}
+    def solve_years_parallel(self): 
+        #constraints, milp and representation search per year on a process pool, results put back into the usual dicts
+        results = solve_all_years(self.all_arrays,self.solve_options(),self.workers,self.type_classes(),self.seats_in_year,self.parties_in_year)
+        self.all_constraints = {year:result['constraints'] for year,result in results.items()}
+        self.all_lin_cons = get_all_lin_cons(self.all_constraints,{year:result['quota_rows'] for year,result in results.items()})
+        self.all_min_weights = {year:result['min_weights'] for year,result in results.items()}
+        self.alternative_weights = {year:result['alternatives'] for year,result in results.items()}
+        if self.lazy_constraints: 
+            self.lazy_stats = {year:result['lazy_stats'] for year,result in results.items()}
+        if self.weight_enumeration == 'nogood': 
+            self.enumeration_stats = {year:result['enumeration_stats'] for year,result in results.items()}
+        if self.warm_start: 
+            self.heuristic_stats = {year:result['heuristic_stats'] for year,result in results.items()}
+            if self.find_errors: 
+                print(self.heuristic_report())
+    def heuristic_report(self): 
+        #heuristic vs exact sum and seconds per year, 'optimal' marks the years where the heuristic alone found the minimum
+        report = pd.DataFrame.from_dict({year:stats for year,stats in self.heuristic_stats.items() if stats is not None},orient='index')
+        if not report.empty: 
+            report['optimal'] = report['heuristic_sum'] == report['exact_sum']
+            if 'cold_seconds' in report: 
+                report['seconds_saved'] = report['cold_seconds'] - report['heuristic_seconds'] - report['exact_seconds']
+        return report
     def All_the_optimal_seats(self): 
         self.optimal_seats = get_all_optimized_seats(self.all_min_weights,self.parties_in_year)
     def verify_found_miw(self): 
-        self.bools,self.errors = verify_coals(self.optimal_seats,self.winning_coal_dict)
+        self.bools,self.errors = verify_coals_incidence(self.optimal_seats,self.all_arrays,self.min_win_masks,self.max_lose_masks,self.seats_in_year,self.parties_in_year,self.quota)
     def all_alt_weights(self): 
-        self.alternative_weights =all_year_all_possible_weights(self.all_min_weights,self.n_in_year,self.all_constraints,self.find_errors)
+        incidence = self.all_arrays if self.lazy_constraints else None
+        if self.weight_enumeration == 'nogood': 
+            self.alternative_weights,self.enumeration_stats = all_year_all_optimal_weights(self.all_min_weights,self.all_constraints,self.max_representations,self.enumeration_time_budget,self.find_errors,incidence)
+        else: 
+            self.alternative_weights =all_year_all_possible_weights(self.all_min_weights,self.n_in_year,self.all_constraints,self.find_errors,incidence)
     def alt_weigths_withnames(self): 
         self.optimal_seats = mvw_to_parties2(self.alternative_weights,self.parties_in_year)
     def verify_types(self): 
         self.crit_cases=check_type_consistency(self.same_type_dict,self.optimal_seats)    
     #power indice wrapper
     def all_power_indices(self): 
-        self.power_indices = get_power_indices(self.optimal_seats,self.minimal_winning_coalitions)
+        self.power_indices,self.power_indices_long = get_power_indices_batched(self.optimal_seats,self.minimal_winning_coalitions,self.quota)
+
+    def type_classes(self): 
+        #same-type classes per year, None solves every party on its own
+        if not self.symmetry_reduction: 
+            return None
+        if self.all_type_classes is None: 
+            self.all_type_classes = get_all_type_classes(self.same_type_dict,self.parties_in_year)
+        return self.all_type_classes
+
+    #quota wrapper
+    def simple_majority(self): 
+        return quota_fraction(self.quota) == quota_fraction(0.5)
+    def quota_batch(self,quotas): 
+        #whole pipeline for several quotas, the data is read and the 2^n tables are built only once (both do not depend on the quota)
+        #returns dict with (quota, dict of results)
+        #nothing is saved: workbook names and store partitions have no quota, every quota would overwrite the one before
+        #self.quota and its coalition dicts are restored afterwards, weights and power indices of self are those of the last quota
+        if self.saveresults: 
+            raise ValueError("quota_batch does not save results, use save_results=False and the returned dict (or one getMVWs per quota)")
+        if self.seats_in_year is None: 
+            self.preliminaries()
+        results = {}
+        original_quota = self.quota
+        try: 
+            for quota in quotas: 
+                self.quota = quota
+                self.quota_coalitions()
+                self.minimal_voting_weights_pipeline()
+                self.all_power_indices()
+                results[quota] = {"Minimal Winning Coalitions":self.minimal_winning_coalitions,"Optimal Seats":self.optimal_seats,
+                                  "Power Indices":self.power_indices,"Critical Cases":self.crit_cases}
+        finally: 
+            self.quota = original_quota
+            self.quota_coalitions()
+        return results
+    def quota_coalitions(self): 
+        #all steps of preliminaries which depend on the quota
+        self.all_type_classes = None
+        self.identify_winning_coalitions()
+        self.find_minimal_winning_coalitions()
+        self.find_sametypes()
+        self.find_maximal_losing_coalitions()
+        self.find_unique_tying_coalitions()
+    def seat_power_indices(self,quotas): 
+        #power indices of the raw seats for several quotas, one count table per year (pb_and_ss_quotas)
+        #returns long dataframe with one row per quota, year and party
+        rows = []
+        for year,seats in self.seats_in_year.items(): 
+            for quota,(pb_list,ss_list) in pb_and_ss_quotas(np.asarray(seats,dtype=np.int64),quotas).items(): 
+                rows.extend(zip([quota]*len(seats),[year]*len(seats),self.parties_in_year[year],seats,pb_list,ss_list))
+        return pd.DataFrame(rows,columns=['Quota','Year','Party','Seats','Penrose-Banzhaf','Shapely-Shubik'])
+
+    #simulation wrapper, needs preliminaries
+    def simulate(self,year,n_samples=10000,model='dirichlet',concentration=1000,sd=2.0,seed=None): 
+        self.simulations[year] = simulate_parliament(self.seats_in_year[year],self.parties_in_year[year],n_samples,model,concentration,sd,seed,self.cache_path,self.quota)
+        return self.simulations[year]
+
+    #cache wrapper
+    def cache_variant(self): 
+        #settings which change the stored results, part of the cache key
+        #max_representations and enumeration_time_budget cap the stored alternatives, a run with a larger cap must not get a truncated list
+        return (self.weight_enumeration + f'|max={self.max_representations}|budget={self.enumeration_time_budget}' + ('|types' if self.symmetry_reduction else '') 
+                + ('' if self.simple_majority() else f'|quota={quota_fraction(self.quota)}'))
+    def solve_years_cached(self): 
+        #looks up every year in the canonical-game cache, only unknown games get the milp (once per distinct game)
+        #weights are mapped back from the canonical order to the party order of the year
+        self.game_keys = get_all_canonical_games(self.min_win_masks,self.seats_in_year,self.cache_variant())
+        conn = open_game_cache(self.cache_path)
+        cached = {}
+        for year,(key,order) in self.game_keys.items(): 
+            entry = cache_lookup(conn,key)
+            if entry is not None and entry['weights'] is not None and entry['alternatives'] is not None: 
+                cached[key] = entry
+        to_solve = {} # first year of every unknown game
+        solving = set()
+        for year,(key,order) in self.game_keys.items(): 
+            if key not in cached and key not in solving: 
+                to_solve[year] = self.all_arrays[year]
+                solving.add(key)
+        results = solve_all_years(to_solve,self.solve_options(),self.workers,self.type_classes(),self.seats_in_year)
+        for year,result in results.items(): 
+            key,order = self.game_keys[year]
+            entry = {'weights':to_canonical(result['min_weights'].tolist(),order),
+                     'alternatives':[to_canonical(np.asarray(w).tolist(),order) for w in self.as_weight_list(result['alternatives'])]}
+            cache_store(conn,key,len(order),entry['weights'],entry['alternatives'])
+            cached[key] = entry
+        evict(conn,self.cache_max_entries,self.cache_max_bytes)
+        conn.close()
+        self.all_constraints = {year:result['constraints'] for year,result in results.items()} # only the solved years
+        if self.warm_start: 
+            self.heuristic_stats = {year:result['heuristic_stats'] for year,result in results.items()}
+        self.all_lin_cons = get_all_lin_cons(self.all_constraints,{year:result['quota_rows'] for year,result in results.items()})
+        self.all_min_weights = {}
+        self.alternative_weights = {}
+        for year,(key,order) in self.game_keys.items(): 
+            self.all_min_weights[year] = np.array(from_canonical(cached[key]['weights'],order),dtype=float)
+            alternatives = [np.array(from_canonical(w,order)) for w in cached[key]['alternatives']]
+            self.alternative_weights[year] = alternatives if len(alternatives) > 1 or self.weight_enumeration == 'nogood' else alternatives[0]
+        self.cache_stats = {'years':len(self.game_keys),'solved':len(results),'cached':len(self.game_keys)-len(results)}
+        if self.find_errors: 
+            print(f"cache: {self.cache_stats['cached']} of {self.cache_stats['years']} years without milp")
+    def as_weight_list(self,alternatives): 
+        #all_year_all_possible_weights keeps a single array for n<=8, the cache always stores a list
+        return [alternatives] if isinstance(alternatives,np.ndarray) else alternatives
+    def all_power_indices_cached(self): 
+        #power indices of known games are read from the cache, the others are computed and stored
+        conn = open_game_cache(self.cache_path)
+        self.power_indices = {}
+        for year,(key,order) in self.game_keys.items(): 
+            entry = cache_lookup(conn,key)
+            weights_dict = grab_relevant_weights(self.optimal_seats,year)
+            if entry is not None and entry['power'] is not None: 
+                pb_list = from_canonical(entry['power']['pb'],order)
+                ss_list = from_canonical(entry['power']['ss'],order)
+                self.power_indices[year] = combine_names_and_indices(weights_dict,pb_list,ss_list,msr_index_i(weights_dict))
+            else: 
+                df = power_indices_year(self.optimal_seats,self.minimal_winning_coalitions,year,self.quota)
+                cache_store(conn,key,len(order),power={'pb':to_canonical(df['Penrose-Banzhaf'].astype(float).tolist(),order),
+                                                       'ss':to_canonical(df['Shapely-Shubik'].astype(float).tolist(),order)})
+                self.power_indices[year] = df
+        evict(conn,self.cache_max_entries,self.cache_max_bytes)
+        conn.close()
+        #long table like get_power_indices_batched, the cache only holds the first representation
+        rows = []
+        for year,df in self.power_indices.items(): 
+            weights = np.array([grab_relevant_weights(self.optimal_seats,year)[party][0] for party in df['Party']],dtype=float)
+            rows.append(pd.DataFrame({'Year':year,'Representation':0,'Party':df['Party'],'Weight':weights,'Penrose-Banzhaf':df['Penrose-Banzhaf'],
+                                      'Shapely-Shubik':df['Shapely-Shubik'],'Minimal-Sum':weights/weights.sum() if weights.sum()>0 else 0.0,
+                                      'Mode':'int64','PB error':0.0,'SS error':0.0}))
+        self.power_indices_long = pd.concat(rows,ignore_index=True) if rows else None
         
\ No newline at end of file
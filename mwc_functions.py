@@ -1,6 +1,8 @@
 import os
 import pandas as pd
+import numpy as np
 import itertools
+from fractions import Fraction
 
 def read_csv_to_dataframe(filename, encoding='utf-16',delimiter='\t'):
     ## takes in the filename as 'xy.csv' and allows for an encoding parameter (uft-16 is apparently used by the Political Data Yearbook)
@@ -58,6 +60,7 @@ def variables_by_year(df):
 
 
 def coalition_combinatorics_generator(df,parties_in_year):
+    '''outdated method - string keys for all 2^n coals, use coalition_bitmask_generator'''
     ## takes in a dataframe from transform_and_sort_dataframe
     ## creates a dict for all coalitions in a given year and their seats
     coalition_dict = {}
@@ -211,4 +214,221 @@ def unique_tying_coals(coalition_dict, totalseats_in_year, parties_in_year):
                 if not any(coal in unique_tying for coal in [coal_tuple,complment_tuple]): #any checks whether either the coal_tuple or the complement tuple are already in the unique tying dict. (testing for one should also work if one were to check for both sides of the key)
                     unique_tying[(year, (coalition, complementary_coal))] = 0 
 
-    return unique_tying
\ No newline at end of file
+    return unique_tying
+
+###################### Bitmask coalition engine #################
+## coalitions are stored as integer bitmasks over the party order of parties_in_year[year]
+## bit i is set if parties_in_year[year][i] is member of the coalition, i.e. 'A+C' in ['A','B','C'] is 0b101=5
+## seats of all 2^n coalitions are held in one np.array per year where the index is the bitmask
+## names ('A+B+C') are only rebuilt with mask_to_coal when results are saved
+## quota: share of all seats which has to be exceeded to win (0.5 simple majority, 0.6, '2/3', ...), winning is again a strict inequality
+
+def quota_fraction(quota=0.5):
+    ## exact fraction of a quota, floats are turned into the closest simple fraction (2/3 as float is not exactly 2/3)
+    return Fraction(quota) if isinstance(quota, (str, Fraction)) else Fraction(quota).limit_denominator(10**4)
+
+def winning_threshold(totalseats, quota=0.5):
+    ## smallest number of seats exceeding quota*totalseats, i.e. totalseats//2+1 for the simple majority
+    quota = quota_fraction(quota)
+    return int(totalseats) * quota.numerator // quota.denominator + 1
+
+def seats_by_year(df,parties_in_year):
+    ## takes in a dataframe from transform_and_sort_dataframe and the parties dict from variables_by_year
+    ## returns dict with (year, np.array of seats), position i in the array belongs to parties_in_year[year][i]
+    seats_in_year = {}
+    for YearMonth, group in df.groupby('YearMonth'):
+        seats = dict(zip(group['Party'], group['# of Seats']))
+        seats_in_year[YearMonth] = np.array([seats[party] for party in parties_in_year[YearMonth]],dtype=np.int64)
+    return seats_in_year
+
+def coalition_seat_array(seats):
+    '''subset-sum recurrence: returns np.array of length 2^n where entry [mask] stores the seats of coalition mask'''
+    ## all coals without party i are already in the array, all coals with party i are the same coals plus the seats of i
+    ## thus every party doubles the array: coal_seats[mask + 2^i] = coal_seats[mask] + seats[i]
+    coal_seats = np.zeros(1,dtype=np.int64) # empty coalition
+    for party_seats in seats:
+        coal_seats = np.concatenate((coal_seats, coal_seats + party_seats))
+    return coal_seats
+
+def coalition_bitmask_generator(seats_in_year, max_n=None):
+    ## takes in dict from seats_by_year
+    ## compact replacement of coalition_combinatorics_generator, stores one seat array per year
+    ## years with more than max_n parties are left out, their mwc/mlc come from min_winning_dfs/max_losing_dfs
+    return {year: coalition_seat_array(seats) for year, seats in seats_in_year.items() if max_n is None or len(seats) <= max_n}
+
+def win_coals_bitmask(coalition_seats, totalseats_in_year, quota=0.5):
+    ## takes in dict from coalition_bitmask_generator
+    ## returns dict with (year, boolean array) where [mask] is True if the coal is winning (again strict inequality)
+    return {year: coal_seats >= winning_threshold(totalseats_in_year[year], quota) for year, coal_seats in coalition_seats.items()}
+
+def min_winning_masks(winning_coalitions):
+    ## takes in dict from win_coals_bitmask
+    ## a winning coal is minimal if removing any member i makes it losing --> one vectorized check per party instead of splitting strings
+    ## returns dict with (year, np.array of bitmasks) sorted like itertools.combinations would list them
+    min_win_masks = {}
+    for year, winning in winning_coalitions.items():
+        n = len(winning).bit_length() - 1
+        masks = np.arange(len(winning),dtype=np.int64)
+        is_minimal = winning.copy()
+        for i in range(n):
+            has_i = (masks >> i) & 1 == 1
+            is_minimal &= ~(has_i & winning[masks ^ (1 << i)]) # coal without i still winning --> not minimal
+        min_win_masks[year] = coalition_order(np.flatnonzero(is_minimal), n)
+    return min_win_masks
+
+def max_losing_masks(winning_coalitions):
+    ## inverse to min_winning_masks: a losing coal is maximal if adding any non-member i makes it winning
+    max_lose_masks = {}
+    for year, winning in winning_coalitions.items():
+        n = len(winning).bit_length() - 1
+        masks = np.arange(len(winning),dtype=np.int64)
+        is_maximal = ~winning
+        for i in range(n):
+            lacks_i = (masks >> i) & 1 == 0
+            is_maximal &= ~(lacks_i & ~winning[masks | (1 << i)]) # coal plus i still losing --> not maximal
+        max_lose_masks[year] = coalition_order(np.flatnonzero(is_maximal), n)
+    return max_lose_masks
+
+def party_types_bitmask(min_win_masks, seats_in_year, parties_in_year):
+    '''checks whether any two parties are of the same type, same result as party_types but in one pass per year'''
+    ## party_types swaps a and b in every mwc containing exactly one of them and compares the seats of both coals
+    ## swapping changes the seats by seats_b-seats_a, so a pair is of the same type iff
+    ##   a) both have the same seats or 
+    ##   b) no mwc contains exactly one of them (their columns in the mwc incidence matrix are identical)
+    ## b) follows from the membership signatures: #(mwc with exactly one) = count_a + count_b - 2*#(mwc with both)
+    ## output: dict with keys: year and value: list of tuples, each tuple indicates parties of the same type
+    types = {}
+    for year, masks in min_win_masks.items():
+        parties = parties_in_year[year]
+        seats = np.asarray(seats_in_year[year])
+        incidence = (masks[:, None] >> np.arange(len(parties))) & 1 # rows: mwc, cols: parties
+        counts = incidence.sum(axis=0)
+        both = incidence.T @ incidence
+        exactly_one = counts[:, None] + counts[None, :] - 2 * both
+        relevant = counts > 0 # drop dummy players
+        same_type = (seats[:, None] == seats[None, :]) | (exactly_one == 0)
+        same_type &= relevant[:, None] & relevant[None, :]
+        a_idx, b_idx = np.nonzero(np.triu(same_type, k=1)) # every pair once
+        types[year] = sorted(tuple(sorted((parties[a], parties[b]))) for a, b in zip(a_idx, b_idx))
+    return types
+
+def unique_tying_dp(seats_in_year, totalseats_in_year, parties_in_year):
+    ## same output as unique_tying_coals, but neither needs the string coalition_dict nor the 2^n seat arrays
+    ## in even parliaments coals with exactly half the seats tie with their complement, every pair is listed once
+    unique_tying = {}
+    for year, seats in seats_in_year.items():
+        if totalseats_in_year[year] % 2 == 0: #even-check
+            parties = parties_in_year[year]
+            grand_coalition = (1 << len(parties)) - 1
+            listed = set()
+            for mask in coalition_order(tying_masks(seats, int(totalseats_in_year[year] // 2)), len(parties)):
+                if mask not in listed: # complement is tying as well and comes later
+                    complement = grand_coalition ^ int(mask)
+                    listed.update((int(mask), complement))
+                    unique_tying[(year, (mask_to_coal(mask, parties), mask_to_coal(complement, parties)))] = 0
+    return unique_tying
+
+def tying_masks(seats, half_seats):
+    '''subset-sum dp with backtracking: returns np.array of all bitmasks with exactly half_seats seats'''
+    ## reachable[i][s] is True if parties i..n-1 can add up to exactly s seats
+    ## backtracking only follows branches where the remaining seats are still reachable, so only tying coals are visited
+    n = len(seats)
+    reachable = np.zeros((n + 1, half_seats + 1), dtype=bool)
+    reachable[n, 0] = True # empty coalition
+    for i in range(n - 1, -1, -1):
+        reachable[i] = reachable[i + 1]
+        if seats[i] <= half_seats:
+            reachable[i, seats[i]:] |= reachable[i + 1, :half_seats + 1 - seats[i]] # coals with party i
+    found = []
+
+    def backtrack(i, remaining, mask):
+        if i == n:
+            found.append(mask)
+            return
+        if reachable[i + 1, remaining]: # without party i
+            backtrack(i + 1, remaining, mask)
+        if seats[i] <= remaining and reachable[i + 1, remaining - seats[i]]: # with party i
+            backtrack(i + 1, remaining - seats[i], mask | (1 << i))
+
+    if reachable[0, half_seats]:
+        backtrack(0, half_seats, 0)
+    return np.array(found, dtype=np.int64)
+
+def minimal_coalitions_dfs(seats, threshold):
+    '''pruned depth-first search for all minimal coalitions with at least threshold seats'''
+    ## parties are visited sorted by seats (largest first), so the party added last is always the smallest member
+    ## a coal reaching the threshold is thus minimal as soon as it is found: dropping its smallest member falls below the threshold
+    ## branches are cut once even all remaining parties can not reach the threshold --> never touches all 2^n coals
+    ## returns np.array of bitmasks in the original party order
+    order = np.argsort(-np.asarray(seats), kind='stable')
+    sorted_seats = [int(seats[i]) for i in order]
+    bits = [1 << int(i) for i in order]
+    n = len(sorted_seats)
+    suffix = [sum(sorted_seats[j:]) for j in range(n + 1)] # seats still available from position j on
+    found = []
+
+    def extend(start, mask, total):
+        for j in range(start, n):
+            if total + suffix[j] < threshold: # suffix only shrinks with j, so no later branch can make it either
+                return
+            if total + sorted_seats[j] >= threshold:
+                found.append(mask | bits[j])
+            else:
+                extend(j + 1, mask | bits[j], total + sorted_seats[j])
+
+    extend(0, 0, 0)
+    return np.array(found, dtype=np.int64)
+
+def min_winning_dfs(seats_in_year, totalseats_in_year, quota=0.5):
+    ## takes in dict from seats_by_year
+    ## same output as min_winning_masks, but enumerates the mwc directly without the 2^n winning arrays
+    ## winning: seats > quota*totalseats, i.e. at least totalseats//2+1 seats for the simple majority
+    min_win_masks = {}
+    for year, seats in seats_in_year.items():
+        masks = minimal_coalitions_dfs(seats, winning_threshold(totalseats_in_year[year], quota))
+        min_win_masks[year] = coalition_order(masks, len(seats))
+    return min_win_masks
+
+def max_losing_dfs(seats_in_year, totalseats_in_year, quota=0.5):
+    ## same output as max_losing_masks without the 2^n winning arrays
+    ## a coal is maximal losing iff its complement is a minimal coal which blocks any majority, i.e. holds at least totalseats - threshold + 1 seats
+    ##     (totalseats - totalseats//2 for the simple majority)
+    max_lose_masks = {}
+    for year, seats in seats_in_year.items():
+        total = int(totalseats_in_year[year])
+        grand_coalition = (1 << len(seats)) - 1
+        blocking = minimal_coalitions_dfs(seats, total - winning_threshold(total, quota) + 1)
+        max_lose_masks[year] = coalition_order(grand_coalition ^ blocking, len(seats))
+    return max_lose_masks
+
+def masks_to_seats(masks, seats):
+    ## seats of every coalition in an array of bitmasks, summed over the members
+    masks = np.asarray(masks, dtype=np.int64)
+    return ((masks[:, None] >> np.arange(len(seats))) & 1) @ np.asarray(seats)
+
+def coalition_order(masks, n):
+    '''sorts bitmasks the way itertools.combinations lists coalitions: by size, then lexicographic in the party order'''
+    masks = np.asarray(masks,dtype=np.int64)
+    members = (masks[:, None] >> np.arange(n)) & 1
+    reversed_masks = members @ (1 << np.arange(n - 1, -1, -1, dtype=np.int64)) # party 0 becomes the highest bit
+    return masks[np.lexsort((-reversed_masks, members.sum(axis=1)))]
+
+def mask_to_coal(mask, parties):
+    ## rebuilds the name of a coalition from its bitmask, 0 is the empty coalition ''
+    mask = int(mask)
+    return '+'.join(party for i, party in enumerate(parties) if (mask >> i) & 1)
+
+def masks_to_coal_dict(masks_in_year, parties_in_year, value):
+    ## takes in a dict of (year, array of bitmasks) such as min_winning_masks
+    ## returns the named dict ((year, coalition), value) as produced by min_winning_coals or max_loosing_coals
+    return {(year, mask_to_coal(mask, parties_in_year[year])): value for year, masks in masks_in_year.items() for mask in masks}
+
+def bitmask_to_coal_dict(arrays_in_year, parties_in_year):
+    ## takes in a dict of full 2^n arrays (coalition_bitmask_generator or win_coals_bitmask)
+    ## rebuilds the named ((year, coalition), value) dict of coalition_combinatorics_generator / win_coals, only used for saving
+    named_dict = {}
+    for year, values in arrays_in_year.items():
+        parties = parties_in_year[year]
+        for mask in coalition_order(np.arange(len(values)), len(parties)):
+            named_dict[(year, mask_to_coal(mask, parties))] = int(values[mask])
+    return named_dict
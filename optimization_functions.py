@@ -3,9 +3,14 @@ import numpy as np
 import itertools
 from itertools import combinations
 import time 
+from concurrent.futures import ProcessPoolExecutor
 from scipy import optimize
 from scipy.optimize import LinearConstraint
 from scipy.optimize import milp
+from scipy import sparse
+from fractions import Fraction
+
+from mwc_functions import coalition_seat_array, coalition_order, mask_to_coal, quota_fraction, winning_threshold
 
 
 def create_all_year_dfs(winning_coal_dict, parties_in_year):
@@ -26,6 +31,28 @@ def create_all_year_dfs(winning_coal_dict, parties_in_year):
 
     return all_year_dfs
 
+def masks_to_incidence(masks, n):
+    ## turns an array of coalition bitmasks into a contiguous uint8 incidence matrix, rows: coalitions, cols: parties
+    masks = np.asarray(masks, dtype=np.int64)
+    return np.ascontiguousarray((masks[:, None] >> np.arange(n)) & 1, dtype=np.uint8)
+
+def create_all_year_arrays(min_win_masks, max_lose_masks, n_in_year):
+    ## array-backed replacement of create_all_year_dfs
+    ## takes in the bitmask dicts from min_winning_dfs and max_losing_dfs
+    ## stores (winning_array, losing_array) per year in a dict with key= year, one vectorized step per year
+    all_year_arrays = {}
+    for year, win_masks in min_win_masks.items():
+        n = n_in_year[year]
+        all_year_arrays[year] = (masks_to_incidence(win_masks, n), masks_to_incidence(max_lose_masks[year], n))
+    return all_year_arrays
+
+def incidence_to_df(winning_array, losing_array, parties, win_names, lose_names):
+    ## labelled view of one year of create_all_year_arrays, same layout as the dfs from create_all_year_dfs
+    ## only built on demand
+    df = pd.DataFrame(np.vstack((winning_array, losing_array)), index=list(win_names) + list(lose_names), columns=parties)
+    df['Winning'] = [1] * len(winning_array) + [0] * len(losing_array)
+    return df
+
 def generate_constraints_df(df):
     '''outdated method - very slow for n>10'''
     ## heart of the optimization pipeline 
@@ -107,6 +134,78 @@ def generate_eff_cons(df):
     
     return constraints_df
 
+def generate_eff_cons_arrays(winning_array, losing_array, parties):
+    '''main method to create constraints, same as generate_eff_cons but reads the incidence arrays directly'''
+    ## dense version of generate_sparse_cons (no deduplication), all w(S)-w(R) rows come from one broadcasted difference
+    n = len(parties)
+    winning_array = winning_array.astype(np.int64) # uint8 would wrap around for win_row-lose_row
+    losing_array = losing_array.astype(np.int64)
+    diff_rows = (winning_array[:, None, :] - losing_array[None, :, :]).reshape(-1, n) # row order: every winning row with all losing rows
+    constraints_array = np.vstack([np.eye(n, dtype='int'), diff_rows.astype('int')]) # non-negativity constraints first
+    constraints_df = pd.DataFrame(constraints_array, columns=[f'w_{party}' for party in parties])
+    return constraints_df
+
+def generate_sparse_cons(winning_array, losing_array, dominance_limit=4000):
+    '''main method to create constraints: vectorized, deduplicated and as scipy.sparse csr matrix'''
+    ## all w(S)-w(R) rows come from one broadcasted difference of the incidence arrays
+    ## every row has entries in {-1,0,1}, so it is stored as one base-3 number --> the difference of two rows is the difference of their keys
+    ##     (incidence arrays of merged party types hold counts up to m, then base 2m+1)
+    ## identical rows are dropped right away by np.unique on the keys
+    ## since all weights are non-negative, a row which is componentwise >= another row is implied by it and dropped as well
+    ##     (pairwise check is quadratic in rows, so only done up to dominance_limit rows)
+    ## first n rows stay the non-negativity constraints, just like in generate_eff_cons
+    n = winning_array.shape[1]
+    max_count = int(max(winning_array.max(initial=1), losing_array.max(initial=1)))
+    base = 2 * max_count + 1
+    if n * np.log2(base) < 62: # keys still fit into int64, i.e. n <= 39 for base 3
+        powers = base ** np.arange(n, dtype=np.int64)
+        offset = max_count * powers.sum() # shifts -m..m to digits 0..2m
+        keys = (winning_array.astype(np.int64) @ powers)[:, None] - (losing_array.astype(np.int64) @ powers)[None, :] + offset
+        keys = np.unique(keys)
+        diff_rows = ((keys[:, None] // powers) % base - max_count).astype(np.int8)
+    else:
+        diff = winning_array.astype(np.int8)[:, None, :] - losing_array.astype(np.int8)[None, :, :]
+        diff_rows = np.unique(diff.reshape(-1, n), axis=0)
+    if len(diff_rows) <= dominance_limit:
+        diff_rows = drop_dominated_rows(diff_rows)
+    constraints = sparse.vstack([sparse.identity(n, dtype=np.int8, format='csr'), sparse.csr_matrix(diff_rows)], format='csr')
+    return constraints
+
+def drop_dominated_rows(rows, block=256):
+    '''helper function for generate_sparse_cons'''
+    ## takes in unique constraint rows, drops every row which is componentwise >= some other row
+    ## distinct dominating rows always have a strictly larger sum, so the minimal rows survive
+    keep = np.ones(len(rows), dtype=bool)
+    for start in range(0, len(rows), block):
+        blk = rows[start:start + block]
+        dominated = (rows[None, :, :] <= blk[:, None, :]).all(axis=2) # [i,j]: row j <= row start+i
+        dominated[np.arange(len(blk)), start + np.arange(len(blk))] = False # a row does not dominate itself
+        keep[start:start + block] = ~dominated.any(axis=1)
+    return rows[keep]
+
+def quota_rows(winning_array, losing_array, quota=0.5, costs=None):
+    '''extra constraint rows for quotas other than 1/2, passed to the milp next to the rows of generate_sparse_cons'''
+    ## w(S)-w(R)>=1 only asks the weights to separate mwc and mlc, for the simple majority the thesis weights then also satisfy w(S) > w(N)/2
+    ## for other quotas a/b the weights have to reproduce the game with the same relative quota (winning means strictly above it): 
+    ##     b*w(S) - a*w(N) >= 1 for every mwc and a*w(N) - b*w(R) >= 0 for every mlc (a losing coalition may sit exactly on the quota)
+    ## costs: class sizes of merged party types, w(N) is costs*w then
+    ## returns (csr matrix, lower bounds of its rows), None for quota 1/2
+    quota = quota_fraction(quota)
+    if quota == Fraction(1, 2):
+        return None
+    n = winning_array.shape[1]
+    total = np.ones(n, dtype=np.int64) if costs is None else np.asarray(costs, dtype=np.int64)
+    win_rows = np.unique(quota.denominator * winning_array.astype(np.int64) - quota.numerator * total, axis=0)
+    lose_rows = np.unique(quota.numerator * total - quota.denominator * losing_array.astype(np.int64), axis=0)
+    return sparse.csr_matrix(np.vstack([win_rows, lose_rows])), np.concatenate([np.ones(len(win_rows)), np.zeros(len(lose_rows))])
+
+def quota_feasible(candidates, extra_rows):
+    '''helper function for the representation checks: True for every candidate (row of a (k,n) matrix) satisfying the quota_rows'''
+    if extra_rows is None: 
+        return np.ones(len(candidates), dtype=bool)
+    rows, lower = extra_rows
+    return (rows @ np.asarray(candidates).T >= lower[:, None]).all(axis=0)
+
 def verify_conditions(year, winning_coal_dict, constraints_df, n_in_year):
     '''not to be used when using min_winning_coals to create constraints'''
     ## verifys the above conditions to test if: 
@@ -135,15 +234,15 @@ def verify_conditions(year, winning_coal_dict, constraints_df, n_in_year):
 
     return "Correct"
 
-def get_all_constrains(all_year_dfs,find_error= False):
+def get_all_constrains(all_year_arrays,parties_in_year,find_error= False):
     #simple loop to get all constraints into one dict
-    #takes in all_year_df, returns dict with (year,yearly_constraints_df)
+    #takes in all_year_arrays from create_all_year_arrays, returns dict with (year,yearly_constraints) as csr matrix
     all_constraints_dict={}
-    for year,yearly_dfs in all_year_dfs.items(): 
+    for year,(winning_array,losing_array) in all_year_arrays.items(): 
         if find_error: 
             time_1= time.time()
             print(f'year:{year}, started at {time_1} seconds')
-        yearly_constraints= generate_eff_cons(yearly_dfs)
+        yearly_constraints= generate_sparse_cons(winning_array,losing_array)
         if find_error: 
             time_2= time.time()
             time_diff = time_2-time_1
@@ -152,35 +251,50 @@ def get_all_constrains(all_year_dfs,find_error= False):
     return all_constraints_dict
     
     
-def get_lin_cons(constraints_df):
+def get_lin_cons(constraints_df, extra_rows=None):
     # creates constraints usable for milp
     # gets matrix A from constraints_df
     # first n constraints are lhs>=0, 
     # remaining constraints are lhs>0, since lhs will always be integer-valued this is equivalent to lhs>=1 
-    # returns lin_constraint element   
-    A = constraints_df.to_numpy()
-    lbnd = np.zeros(len(constraints_df)) # non-negativity constraints 
-    lbnd[constraints_df.shape[1]:] = 1 #set all remaining lower bounds to 1
-    upbnd = np.full(len(constraints_df), np.inf) #no upper bound 
+    # takes the csr matrix from generate_sparse_cons as is, milp works with sparse matrices
+    # extra_rows: (rows, lower bounds) from quota_rows, added as a second LinearConstraint with their own bounds
+    # returns lin_constraint element (list of both with extra_rows)   
+    A = constraints_df if sparse.issparse(constraints_df) else constraints_df.to_numpy()
+    lbnd = np.zeros(A.shape[0]) # non-negativity constraints 
+    lbnd[A.shape[1]:] = 1 #set all remaining lower bounds to 1
+    upbnd = np.full(A.shape[0], np.inf) #no upper bound 
 
     lin_cons = LinearConstraint(A, lbnd, upbnd)
+    if extra_rows is not None: 
+        lin_cons = [lin_cons, LinearConstraint(extra_rows[0], extra_rows[1], np.full(extra_rows[0].shape[0], np.inf))]
 
     return lin_cons
 
-def get_all_lin_cons(all_constraints_dict): 
+def get_all_lin_cons(all_constraints_dict, all_extra_rows=None): 
     ##simple loop again to transform all constraints into linear constraints
+    ##all_extra_rows: dict with (year, quota_rows) for quotas other than 1/2
     all_lin_cons_dict={}
     for year,yearly_constraints in all_constraints_dict.items():
         constraints = yearly_constraints
-        lin_cons = get_lin_cons(constraints)
+        lin_cons = get_lin_cons(constraints, all_extra_rows.get(year) if all_extra_rows is not None else None)
         all_lin_cons_dict[year]=lin_cons
     return all_lin_cons_dict
      
-def get_min_vote_weights(year,n_in_year,constraints): 
+def get_min_vote_weights(year,n_in_year,constraints,costs=None,incumbent=None): 
     ## passes constraints to optimizer
     ## sets coefficients to 1 (since we need an unweighted sum to be minimized), sets all weights to be full-integers
+    ## costs: coefficients for merged party types (number of parties sharing the weight), 1 if None
+    ## incumbent: feasible integer weights (heuristic_weights), their sum is an upper bound for the milp
+    ##     if the lp relaxation already reaches that sum the incumbent is optimal and the milp is skipped (message 'incumbent')
     ## returns optimization object 
-    mvw = optimize.milp(np.full(n_in_year[year],1), integrality=np.full(n_in_year[year],1), constraints=constraints)
+    costs = np.full(n_in_year[year],1) if costs is None else costs
+    if incumbent is not None: 
+        cutoff = float(np.asarray(incumbent) @ costs)
+        relaxation = optimize.milp(costs, constraints=constraints) # no integrality --> lp
+        if relaxation.success and np.ceil(relaxation.fun - 1e-6) >= cutoff: 
+            return optimize.OptimizeResult(x=np.asarray(incumbent, dtype=float), fun=cutoff, success=True, status=0, message='incumbent')
+        constraints = (constraints if isinstance(constraints, list) else [constraints]) + [LinearConstraint(np.asarray(costs, dtype=float).reshape(1, -1), -np.inf, cutoff)]
+    mvw = optimize.milp(costs, integrality=np.full(n_in_year[year],1), constraints=constraints)
     return mvw
 
 def get_all_min_vote_weights(all_lin_cons_dict,n_in_year): 
@@ -189,10 +303,131 @@ def get_all_min_vote_weights(all_lin_cons_dict,n_in_year):
     for year,lin_cons in all_lin_cons_dict.items(): 
         yearly_lincons = lin_cons
         yearly_mvw_results = get_min_vote_weights(year,n_in_year,yearly_lincons)
-        yearly_mvws =np.round_(yearly_mvw_results.x) ##for some very useful reason milp outputs int64 values. np.round() rounds to the neares integer
+        yearly_mvws =np.round(yearly_mvw_results.x) ##for some very useful reason milp outputs int64 values. np.round() rounds to the neares integer (np.round_ is gone in numpy 2)
         all_min_vote_weights[year]=yearly_mvws
     return all_min_vote_weights
 
+def get_min_vote_weights_lazy(winning_array, losing_array, max_iterations=200, chunk_rows=1024, costs=None, incumbent=None, extra_rows=None):
+    '''cutting-plane version of get_min_vote_weights, never builds the full |W|*|L| constraint matrix'''
+    ## starts from a small seed set: every mwc against the mlc it shares the most parties with and vice versa
+    ## then repeats: solve milp on the current rows --> separation oracle on the candidate weights --> add violated (S,R) pairs
+    ## the oracle is cheap: weights represent the game iff min_S w(S) >= max_R w(R) + 1, so for every violated row only the most violating partner is added
+    ## extra_rows: (rows, lower bounds) from quota_rows, always active, not part of the returned constraints
+    ## if the milp fails or max_iterations runs out with violated pairs left, the full problem (generate_sparse_cons) is solved instead
+    ## returns optimization object of the last solve and a dict with iteration and constraint counts, 'converged' and 'fallback'
+    n = winning_array.shape[1]
+    costs = np.full(n,1) if costs is None else costs
+    W = winning_array.astype(np.int64)
+    L = losing_array.astype(np.int64)
+    pairs = set()
+    # seed set, overlaps in chunks of winning rows so |W|*|L| never sits in memory at once
+    best_win_for_lose = np.zeros(len(L), dtype=np.int64)
+    best_overlap = np.full(len(L), -1)
+    for start in range(0, len(W), chunk_rows):
+        overlap = W[start:start + chunk_rows] @ L.T
+        pairs.update(zip(range(start, start + len(overlap)), overlap.argmax(axis=1).tolist()))
+        chunk_best = overlap.argmax(axis=0)
+        chunk_overlap = overlap[chunk_best, np.arange(len(L))]
+        better = chunk_overlap > best_overlap
+        best_overlap[better] = chunk_overlap[better]
+        best_win_for_lose[better] = start + chunk_best[better]
+    pairs.update(zip(best_win_for_lose.tolist(), range(len(L))))
+
+    for iteration in range(1, max_iterations + 1):
+        rows = np.array(sorted(pairs))
+        constraints = sparse.vstack([sparse.identity(n, dtype=np.int64, format='csr'), sparse.csr_matrix(W[rows[:, 0]] - L[rows[:, 1]])], format='csr')
+        lin_cons = get_lin_cons(constraints, extra_rows)
+        if incumbent is not None: # objective cutoff, the optimum of the full game is never above the incumbent
+            lin_cons = (lin_cons if isinstance(lin_cons, list) else [lin_cons]) + [LinearConstraint(np.asarray(costs, dtype=float).reshape(1, -1), -np.inf, float(np.asarray(incumbent) @ costs))]
+        mvw = optimize.milp(costs, integrality=np.full(n,1), constraints=lin_cons)
+        if mvw.x is None: # milp failed (status in mvw.message), no candidate weights for the oracle
+            converged = False
+            break
+        new_pairs = violated_pairs(np.round(mvw.x), W, L) - pairs
+        converged = not new_pairs
+        if converged: # no violated pair left --> optimal for the full problem
+            break
+        pairs |= new_pairs
+    n_extra = extra_rows[0].shape[0] if extra_rows is not None else 0
+    stats = {'iterations': iteration, 'converged': converged, 'fallback': False, 'constraints': constraints.shape[0] + n_extra,
+             'full_constraints': len(W) * len(L) + n + n_extra}
+    if not converged: # weights of the last solve do not represent the game --> full constraint matrix
+        constraints = generate_sparse_cons(winning_array, losing_array)
+        mvw = get_min_vote_weights(0, {0: n}, get_lin_cons(constraints, extra_rows), costs, incumbent)
+        if mvw.x is None: 
+            raise RuntimeError(f"milp failed for the full constraints as well: {mvw.message}")
+        stats.update({'fallback': True, 'constraints': constraints.shape[0] + n_extra})
+    return mvw, constraints, stats
+
+def violated_pairs(weights, winning_array, losing_array):
+    ## separation oracle for get_min_vote_weights_lazy and enumerate_optimal_weights
+    ## returns set of (winning row, losing row) pairs with w(S)-w(R) < 1, for every violated row only its most violating partner
+    win_weights = winning_array @ weights
+    lose_weights = losing_array @ weights
+    min_win, max_lose = win_weights.min(), lose_weights.max()
+    pairs = {(int(i), int(lose_weights.argmax())) for i in np.flatnonzero(win_weights < max_lose + 1)}
+    pairs |= {(int(win_weights.argmin()), int(j)) for j in np.flatnonzero(lose_weights > min_win - 1)}
+    return pairs
+
+def get_all_min_vote_weights_lazy(all_year_arrays, find_error=False):
+    #simple loop over all cutting-plane problems
+    #returns dicts with (year, weights), (year, final active constraints) and (year, stats)
+    all_min_vote_weights = {}
+    all_active_constraints = {}
+    all_stats = {}
+    for year, (winning_array, losing_array) in all_year_arrays.items():
+        mvw, constraints, stats = get_min_vote_weights_lazy(winning_array, losing_array)
+        all_min_vote_weights[year] = np.round(mvw.x)
+        all_active_constraints[year] = constraints
+        all_stats[year] = stats
+        if find_error:
+            print(f"year:{year}, {stats['iterations']} iterations, {stats['constraints']} of {stats['full_constraints']} constraints"
+                  + ('' if stats['converged'] else ', not converged --> full constraints'))
+    return all_min_vote_weights, all_active_constraints, all_stats
+
+def represents_game(weights, winning_array, losing_array):
+    ## separation oracle as a check: True if all mwc outweigh all mlc by at least 1
+    return (winning_array @ weights).min() >= (losing_array @ weights).max() + 1
+
+def heuristic_weights(winning_array, losing_array, seats, previous=None, costs=None, scales=30):
+    '''fast feasible integer weights as incumbent for the milp'''
+    ## start points: the seats themselves (always a representation), seats scaled down to a few max values and rounded,
+    ##     and the weights of the previous election if given (same parties in the same order)
+    ## the smallest representing start point is shrunk by a local search: every weight is lowered as far as represents_game allows
+    ##     (for fixed other weights the feasible values of one weight are an interval, so a binary search finds its lower end)
+    ##     passes over all parties are repeated until no weight can be lowered anymore
+    ## returns integer weights (None if no start point represents the game) and a dict with start point, sums and seconds
+    start_time = time.time()
+    seats = np.asarray(seats, dtype=float)
+    costs = np.ones(len(seats)) if costs is None else np.asarray(costs, dtype=float)
+    starts = {'seats': np.round(seats)}
+    for target in np.unique(np.round(np.geomspace(1, max(seats.max(), 1), scales))): 
+        starts[f'scaled {int(target)}'] = np.round(seats * target / max(seats.max(), 1))
+    if previous is not None and len(previous) == len(seats): 
+        starts['previous'] = np.round(np.asarray(previous, dtype=float))
+    feasible = {name: w for name, w in starts.items() if w.min() >= 0 and represents_game(w, winning_array, losing_array)}
+    if not feasible: 
+        return None, {'start': None, 'start_sum': None, 'heuristic_sum': None, 'heuristic_seconds': time.time() - start_time}
+    start = min(feasible, key=lambda name: feasible[name] @ costs)
+    weights = feasible[start].copy()
+    improved = True
+    while improved: 
+        improved = False
+        for i in np.argsort(-weights, kind='stable'): 
+            current = int(weights[i])
+            low, high = 0, current # high is feasible
+            while low < high: 
+                mid = (low + high) // 2
+                weights[i] = mid
+                if represents_game(weights, winning_array, losing_array): 
+                    high = mid
+                else: 
+                    low = mid + 1
+            weights[i] = high
+            improved |= high < current
+    stats = {'start': start, 'start_sum': float(feasible[start] @ costs), 'heuristic_sum': float(weights @ costs), 'heuristic_seconds': time.time() - start_time}
+    return weights, stats
+
 def mvw_to_parties(year, optimizer_results, parties_in_year):
     '''dated function, not used anymore'''
     ## takes as input milp object and party dict as well as year. 
@@ -225,6 +460,43 @@ def verify_coals(all_optimized_Seats,winning_coal_dict):
             errors[year]=wrong_coals
     return test_dict,errors            
 
+def verify_coals_bitmask(all_optimized_Seats,winning_coalitions,parties_in_year,quota=0.5):
+    ## same as verify_coals but compares the winning arrays from win_coals_bitmask instead of named dicts
+    ## returns dict of booleans and dict of errors ((year,coalition),(value,mw_value)) just like verify_coals
+    ## years without a full table (more than full_table_max_n parties) are not verified
+    test_dict={}
+    errors={}
+    for year, yearly_matching in all_optimized_Seats.items():
+        if year not in winning_coalitions:
+            continue
+        weights = np.array([yearly_matching[party] for party in parties_in_year[year]])
+        mw_winning = coalition_seat_array(weights) >= winning_threshold(round(weights.sum()), quota) #same game with the optimized weights
+        wrong_masks = coalition_order(np.flatnonzero(mw_winning != winning_coalitions[year]), len(weights))
+        errors[year] = {(year, mask_to_coal(mask, parties_in_year[year])): (int(winning_coalitions[year][mask]), int(mw_winning[mask])) for mask in wrong_masks}
+        test_dict[year] = len(errors[year]) == 0
+    return test_dict,errors
+
+def verify_coals_incidence(all_optimized_Seats,all_year_arrays,min_win_masks,max_lose_masks,seats_in_year,parties_in_year,quota=0.5):
+    ## same output as verify_coals_bitmask but without any 2^n table, works for every year
+    ## two weighted majority games are equal iff every mwc of one is winning and every mlc of one is losing in the other 
+    ##     (every winning coal contains a mwc and every losing coal lies in a mlc)
+    ## --> one product of the incidence arrays with each weight vector (seats and optimized weights) per year
+    ## errors only hold the mwc/mlc which are classified differently ((year,coalition),(value,mw_value)), not every coal of the table
+    test_dict={}
+    errors={}
+    for year, yearly_matching in all_optimized_Seats.items():
+        winning_array, losing_array = all_year_arrays[year]
+        weights = np.array([yearly_matching[party] for party in parties_in_year[year]], dtype=float)
+        seats = np.asarray(seats_in_year[year], dtype=float)
+        masks = np.concatenate([np.asarray(min_win_masks[year], dtype=np.int64), np.asarray(max_lose_masks[year], dtype=np.int64)])
+        incidence = np.vstack([winning_array, losing_array])
+        values = (incidence @ seats >= winning_threshold(round(seats.sum()), quota)).astype(int)
+        mw_values = (incidence @ weights >= winning_threshold(round(weights.sum()), quota)).astype(int)
+        wrong = np.flatnonzero(values != mw_values)
+        errors[year] = {(year, mask_to_coal(masks[i], parties_in_year[year])): (int(values[i]), int(mw_values[i])) for i in wrong}
+        test_dict[year] = len(errors[year]) == 0
+    return test_dict,errors
+
 def help_test_mvws(optimized_seats):
     '''helper function for test_mvws'''
     ## creates dict just like winning_coal_dict but from mvw´s, used later to ensure equivalency of games 
@@ -258,17 +530,36 @@ def test_mvws(year, winning_coal_dict, mw_winning_coal_dict):
     check = len(errors)==0
     return check, errors
 
-def collect_all_representations(weights, year, n_in_year, constraints_df, find_error= False):
+def collect_all_representations(weights, year, n_in_year, constraints_df, find_error= False, incidence=None, costs=None, extra_rows=None):
     '''reports all possible sets of weights given a found minimal sum, up to changes of +1/-1 seats'''
-    ##takes in a vector of weights such as an element from all_min_vote_weights, a year and the standard dict n_in_year, takes in a constraint df such as an element from the all_constraints_dict
+    ##takes in a vector of weights such as an element from all_min_vote_weights, a year and the standard dict n_in_year, takes in a constraint matrix such as an element from the all_constraints_dict
     # creates a list of all other possbile weight vectors with the same sum and changes of +1/-1 for any weight
-    # tests every one of them to be a solution to the same optimization problem 
+    # stacks them into one matrix and tests all of them at once against the constraints (one sparse matrix product instead of one milp per vector)
+    # incidence=(winning_array,losing_array) tests against the game itself instead, needed if constraints_df only holds the active rows of the lazy mode
+    # costs: for merged party types only candidates with the same weighted sum are kept
+    # extra_rows: quota_rows with their own lower bounds, checked on top
     # returns a list of all possible weights  
-    # find_error prints time to test %ages of all possible combinations
+    # find_error prints the time for the test
+    start_time= time.time()
+    candidates = np.array(possible_other_weights(weights))
+    if costs is not None: 
+        candidates = candidates[candidates @ costs == np.round(weights) @ costs]
+    if incidence is not None: 
+        feasible = batch_represents_game(candidates, *incidence)
+    else: 
+        feasible = batch_feasible(candidates, constraints_df)
+    feasible &= quota_feasible(candidates, extra_rows)
+    optimal_weights = [alt_weights for alt_weights, is_feasible in zip(candidates, feasible) if is_feasible]
+    if find_error: 
+        print(f"Tested {len(candidates)} elements in {time.time() - start_time:.4f} seconds, {len(optimal_weights)} are feasible")
+    return optimal_weights    
+
+def collect_all_representations_milp(weights, year, n_in_year, constraints_df, find_error= False):
+    '''outdated method - solves one milp per candidate, use collect_all_representations'''
     alternative_weights = possible_other_weights(weights)
     optimal_weights = []
     total_weights = len(alternative_weights)
-    one_percent = round(total_weights / 100)
+    one_percent = max(1, round(total_weights / 100))
     start_time= time.time()
     for i, alt_weights in enumerate(alternative_weights):
         lin_cons = alt_lin_cons(alt_weights, constraints_df)
@@ -281,27 +572,53 @@ def collect_all_representations(weights, year, n_in_year, constraints_df, find_e
             print(f"Tested {((i + 1) / total_weights) * 100:.2f}% of {total_weights} elements in {elapsed_time:.2f} seconds")
     return optimal_weights    
 
+def batch_feasible(candidates, constraints, chunk_size=4096):
+    '''helper function for collect_all_representations'''
+    ## takes in a (k,n) matrix of candidate weights and the constraint matrix from generate_sparse_cons (first n rows non-negativity)
+    ## a fixed weight vector solves the milp iff it is non-negative and all remaining rows are >= 1
+    ## returns boolean array of length k
+    A = constraints if sparse.issparse(constraints) else sparse.csr_matrix(constraints.to_numpy())
+    n = candidates.shape[1]
+    A = A[n:]
+    feasible = (candidates >= 0).all(axis=1)
+    for start in range(0, len(candidates), chunk_size):
+        lhs = A @ candidates[start:start + chunk_size].T # (constraints, candidates)
+        feasible[start:start + chunk_size] &= (lhs >= 1).all(axis=0)
+    return feasible
+
+def batch_represents_game(candidates, winning_array, losing_array):
+    ## represents_game for a (k,n) matrix of candidate weights, returns boolean array of length k
+    win_weights = winning_array.astype(np.int64) @ candidates.T
+    lose_weights = losing_array.astype(np.int64) @ candidates.T
+    return (candidates >= 0).all(axis=1) & (win_weights.min(axis=0) >= lose_weights.max(axis=0) + 1)
+
 def possible_other_weights(minimal_weights):
     '''helper function for collect_all_representations'''
     #takes in minimal weights from collect_all_representations
-    #iterates over all possible combinations from adding 1 to a weigth and substracting 1 form a different one
-    #returns a list of all possible alternative weights 
+    #all combinations from adding 1 to a weigth and substracting 1 form a different one, built as one matrix of changes
+    #returns a list of all possible alternative weights, original weights last
     
     weight = np.round(minimal_weights).astype(int) # strictly not really necessary....
+    n = len(weight)
     
     # Get unique pairs from ogiginal weights (if w=(1,2,3) this returns ((1,2),(1,3),(2,3)))
-    pairs = list(combinations(range(len(weight)), 2)) # get all possbible pairs of weights 
-    
-    alt_weights = [] 
+    pairs = np.array(list(combinations(range(n), 2)), dtype=int).reshape(-1, 2)
+    rows = np.arange(len(pairs))
+    changes = np.zeros((2 * len(pairs), n), dtype=int)
+    changes[2 * rows, pairs[:, 0]] = 1 #any change is either (i+1,j-1) or (i-1,j+1)
+    changes[2 * rows, pairs[:, 1]] = -1
+    changes[2 * rows + 1, pairs[:, 0]] = -1
+    changes[2 * rows + 1, pairs[:, 1]] = 1
+    candidates = weight + changes
+    candidates = candidates[(candidates >= 0).all(axis=1)] #test non-negativity
     
-    for i, j in pairs: 
-        for change in [(1, -1), (-1, 1)]: #any change is either (i+1,j-1) or (i-1,j+1)
-            new_weights = weight.copy()
-            if new_weights[i] + change[0] >= 0 and new_weights[j] + change[1] >= 0: #test non-negativity
-                new_weights[i] += change[0]
-                new_weights[j] += change[1]
-                if not any(np.array_equal(new_weights, arr) for arr in alt_weights): #test whether new weights already in the list
-                    alt_weights.append(new_weights)
+    alt_weights = []
+    seen = set() #hashing instead of comparing with every element in the list
+    for new_weights in candidates:
+        key = new_weights.tobytes()
+        if key not in seen:
+            seen.add(key)
+            alt_weights.append(new_weights)
     alt_weights.append(weight) #add original weights to the list
     return alt_weights
 
@@ -310,32 +627,220 @@ def alt_lin_cons(minimal_weights, constraints_df):
     #takes in minimal_weights and constraints_df from collect_all_representations 
     #sets the lower and upper bounds for the non-negativity constraints to be the weights to be tested
     #returns linear cosntraint object
-    A = constraints_df.to_numpy()
+    A = constraints_df if sparse.issparse(constraints_df) else constraints_df.to_numpy()
     if isinstance(minimal_weights, list): # necessary from output of possible_other_weights function 
         weights = minimal_weights[0]
     else: weights=minimal_weights
-    lbnd = np.zeros(len(constraints_df))  
+    lbnd = np.zeros(A.shape[0])  
     lbnd[:len(weights)] = weights  
     lbnd[len(weights):] = 1  
-    upbnd = np.full(len(constraints_df), np.inf) 
+    upbnd = np.full(A.shape[0], np.inf) 
     upbnd[:len(weights)] = weights  
     lin_cons = LinearConstraint(A, lbnd, upbnd)
 
     return lin_cons
 
-def all_year_all_possible_weights(all_min_weights,n_in_year,all_constraints,find_error = False): 
+def enumerate_optimal_weights(minimal_weights, constraints, max_solutions=1000, time_budget=60, incidence=None, costs=None, extra_rows=None):
+    '''lists every integer weight vector with the same minimal sum by re-solving with no-good cuts'''
+    ## fixes the objective at the found optimum: sum(w) == sum(minimal_weights)
+    ## since the sum is fixed, any other solution must be smaller than a found solution w* in at least one weight, so each cut is
+    ##     w_i <= w*_i - 1 + M*(1-u_i) for all i with w*_i>0,  sum_i u_i >= 1,  u_i binary,  M = optimum+1 (w_i <= optimum anyway)
+    ## stops as soon as the problem turns infeasible (all solutions found), after max_solutions or after time_budget seconds
+    ## incidence=(winning_array,losing_array) for the active rows of the lazy mode: solutions violating the full game add their violated rows and get re-solved
+    ## costs: coefficients of merged party types, the objective is fixed at costs*w instead (still every other solution is smaller somewhere)
+    ## extra_rows: quota_rows, added below the constraint rows with their own lower bounds
+    ## returns list of weight arrays (minimal_weights first) and dict with count and whether the list is complete
+    start_time = time.time()
+    weights = np.round(minimal_weights).astype(int)
+    n = len(weights)
+    costs = np.ones(n) if costs is None else np.asarray(costs, dtype=float)
+    optimum = int(round(weights @ costs))
+    big_m = optimum + 1
+    A = constraints if sparse.issparse(constraints) else sparse.csr_matrix(constraints.to_numpy())
+    if incidence is not None: 
+        W, L = (arr.astype(np.int64) for arr in incidence)
+    quota_A, quota_lower = extra_rows if extra_rows is not None else (sparse.csr_matrix((0, n)), np.zeros(0))
+    found = [weights]
+    complete = False
+    while len(found) < max_solutions:
+        remaining_time = time_budget - (time.time() - start_time)
+        if remaining_time <= 0:
+            break
+        k = len(found)
+        # variables: n weights, then n binaries u per found solution
+        cut_lhs = sparse.hstack([sparse.vstack([sparse.identity(n)] * k), big_m * sparse.identity(n * k)])
+        cut_ub = np.concatenate([w_star - 1 + big_m for w_star in found])
+        cover = sparse.hstack([sparse.csr_matrix((k, n)), sparse.kron(sparse.identity(k), np.ones((1, n)))])
+        system = sparse.vstack([sparse.hstack([A, sparse.csr_matrix((A.shape[0], n * k))]),
+                                sparse.hstack([quota_A, sparse.csr_matrix((quota_A.shape[0], n * k))]),
+                                sparse.hstack([costs.reshape(1, n), sparse.csr_matrix((1, n * k))]),
+                                cut_lhs, cover], format='csr')
+        lbnd = np.concatenate([np.zeros(n), np.ones(A.shape[0] - n), quota_lower, [optimum], np.full(n * k, -np.inf), np.ones(k)])
+        upbnd = np.concatenate([np.full(A.shape[0] + quota_A.shape[0], np.inf), [optimum], cut_ub, np.full(k, np.inf)])
+        u_upper = np.concatenate([(w_star > 0).astype(float) for w_star in found]) # w*_i = 0 can not get smaller
+        bounds = optimize.Bounds(np.zeros(n + n * k), np.concatenate([np.full(n, optimum), u_upper]))
+        result = optimize.milp(np.concatenate([costs, np.zeros(n * k)]), integrality=np.ones(n + n * k),
+                               bounds=bounds, constraints=LinearConstraint(system, lbnd, upbnd), options={'time_limit': remaining_time})
+        if result.status == 2: # infeasible --> no further solution exists
+            complete = True
+            break
+        if result.status != 0 or result.x is None: # time limit or other failure
+            break
+        candidate = np.round(result.x[:n]).astype(int)
+        if incidence is not None: 
+            pairs = violated_pairs(candidate, W, L)
+            if pairs: # candidate only satisfies the active rows --> add its violated rows and try again
+                rows = np.array(sorted(pairs))
+                A = sparse.vstack([A, sparse.csr_matrix(W[rows[:, 0]] - L[rows[:, 1]])], format='csr')
+                continue
+        found.append(candidate)
+    return found, {'solutions': len(found), 'complete': complete, 'seconds': time.time() - start_time}
+
+def all_year_all_possible_weights(all_min_weights,n_in_year,all_constraints,find_error = False,all_year_arrays=None): 
     ##lets collect_all_representations function run over all years
+    ##if all_constraints only holds the active rows from get_all_min_vote_weights_lazy, pass all_year_arrays to test the representations against the full game
     
     all_year_all_weights = {}
     for year,weights in all_min_weights.items(): 
         yearly_weights = weights
         if len(yearly_weights)>8: #test whether more than 8 players are in the game, for all games with <=8 players min integers are always unique
             constraints=all_constraints.get(year)
-            all_yearly_weights=collect_all_representations(yearly_weights,year,n_in_year,constraints,find_error)
+            incidence = all_year_arrays[year] if all_year_arrays is not None else None
+            all_yearly_weights=collect_all_representations(yearly_weights,year,n_in_year,constraints,find_error,incidence)
             all_year_all_weights[year]=all_yearly_weights
         else: all_year_all_weights[year]=yearly_weights
     return all_year_all_weights
 
+def all_year_all_optimal_weights(all_min_weights,all_constraints,max_solutions=1000,time_budget=60,find_error=False,all_year_arrays=None): 
+    ##lets enumerate_optimal_weights run over all years, no matter how many parties
+    ##returns dict with (year, list of all weight arrays) like all_year_all_possible_weights and dict with (year, enumeration stats)
+    all_year_all_weights = {}
+    all_stats = {}
+    for year,weights in all_min_weights.items(): 
+        incidence = all_year_arrays[year] if all_year_arrays is not None else None
+        all_year_all_weights[year],all_stats[year] = enumerate_optimal_weights(weights,all_constraints[year],max_solutions,time_budget,incidence)
+        if find_error and not all_stats[year]['complete']: 
+            print(f"year:{year}, stopped after {all_stats[year]['solutions']} representations and {all_stats[year]['seconds']:.2f} seconds, list may be incomplete")
+    return all_year_all_weights,all_stats
+
+def solve_year(year, winning_array, losing_array, options, labels=None, seats=None, previous=None):
+    '''one election from incidence arrays to all minimal weights: constraints, milp and representation search'''
+    ## module level so it can be sent to a process pool, only takes and returns compact arrays
+    ## options: dict with the pipeline settings of getMVWs (lazy_constraints, weight_enumeration, max_representations, enumeration_time_budget, find_errors,
+    ##     warm_start, compare_cold)
+    ## labels: party type classes from type_classes, each class is solved as one variable and expanded back afterwards
+    ##     (constraints are then returned in the reduced space)
+    ## seats, previous: seats of the year and weights of the previous election (or None) for the heuristic incumbent if options['warm_start']
+    ## options['quota'] other than 1/2 adds quota_rows to the milp and the representation checks (result['quota_rows'], not part of result['constraints'])
+    result = {'lazy_stats': None, 'enumeration_stats': None, 'heuristic_stats': None}
+    n = winning_array.shape[1]
+    costs = None
+    if labels is not None: 
+        winning_array, losing_array, costs = reduce_incidence(winning_array, losing_array, labels)
+        first_members = np.unique(labels, return_index=True)[1] # seats/previous weights of a class are taken from its first party
+        seats = None if seats is None else np.asarray(seats)[first_members]
+        previous = None if previous is None else np.asarray(previous)[first_members]
+    extra_rows = quota_rows(winning_array, losing_array, options.get('quota', 0.5), costs)
+    result['quota_rows'] = extra_rows
+    incumbent = None
+    if options.get('warm_start') and seats is not None: 
+        incumbent, result['heuristic_stats'] = heuristic_weights(winning_array, losing_array, seats, previous, costs)
+        if incumbent is not None and not quota_feasible(np.asarray(incumbent).reshape(1, -1), extra_rows)[0]: # separates mwc and mlc, but not at the quota
+            incumbent = None
+            result['heuristic_stats']['start'] = 'rejected (quota)'
+    exact_start = time.time()
+    if options['lazy_constraints']: 
+        try: 
+            mvw, result['constraints'], result['lazy_stats'] = get_min_vote_weights_lazy(winning_array, losing_array, costs=costs, incumbent=incumbent, extra_rows=extra_rows)
+        except RuntimeError as error: # the lazy solver does not know the year
+            raise RuntimeError(f"year:{year}, {error}") from error
+        incidence = (winning_array, losing_array)
+    else: 
+        result['constraints'] = generate_sparse_cons(winning_array, losing_array)
+        mvw = get_min_vote_weights(year, {year: winning_array.shape[1]}, get_lin_cons(result['constraints'], extra_rows), costs, incumbent)
+        if mvw.x is None: # infeasible or failed milp, no weights to round
+            raise RuntimeError(f"year:{year}, milp failed: {mvw.message}")
+        incidence = None
+    min_weights = np.round(mvw.x)
+    if result['heuristic_stats'] is not None: 
+        result['heuristic_stats'].update({'exact_sum': float(min_weights @ (np.ones(len(min_weights)) if costs is None else costs)),
+                                          'exact_seconds': time.time() - exact_start, 'milp_skipped': mvw.message == 'incumbent'})
+        if options.get('compare_cold'): # same solve without incumbent, only to measure the time saved
+            cold_start = time.time()
+            if options['lazy_constraints']: 
+                get_min_vote_weights_lazy(winning_array, losing_array, costs=costs, extra_rows=extra_rows)
+            else: 
+                get_min_vote_weights(year, {year: winning_array.shape[1]}, get_lin_cons(result['constraints'], extra_rows), costs)
+            result['heuristic_stats']['cold_seconds'] = time.time() - cold_start
+    if options['weight_enumeration'] == 'nogood': 
+        alternatives, result['enumeration_stats'] = enumerate_optimal_weights(min_weights, result['constraints'], options['max_representations'], options['enumeration_time_budget'], incidence, costs, extra_rows)
+    elif n > 8: #same rule as all_year_all_possible_weights
+        alternatives = collect_all_representations(min_weights, year, {year: n}, result['constraints'], options['find_errors'], incidence, costs, extra_rows)
+    else: 
+        alternatives = min_weights
+    if labels is not None: 
+        min_weights = expand_class_weights(min_weights, labels)
+        alternatives = expand_class_weights(alternatives, labels) if isinstance(alternatives, np.ndarray) else [expand_class_weights(w, labels) for w in alternatives]
+    result['min_weights'] = min_weights
+    result['alternatives'] = alternatives
+    return result
+
+def solve_all_years(all_year_arrays, options, workers=1, all_year_labels=None, all_year_seats=None, all_year_parties=None):
+    ## runs solve_year for every election, on a process pool if workers>1
+    ## biggest problems (|W|*|L|) are submitted first, results come back in the order of all_year_arrays
+    ## all_year_labels: dict with (year, type classes) to merge same-type parties, None solves every party on its own
+    ## all_year_seats: dict with (year, seats) for the heuristic incumbent (options['warm_start'])
+    ## all_year_parties: dict with (year, parties), sequential runs then also try the weights of the previous election with the same parties
+    ## returns dict with (year, result dict from solve_year)
+    labels = {year: all_year_labels.get(year) if all_year_labels is not None else None for year in all_year_arrays}
+    seats = {year: all_year_seats.get(year) if all_year_seats is not None else None for year in all_year_arrays}
+    if workers is None or workers <= 1: 
+        results = {}
+        previous = {} # party --> weight of the last solved election
+        for year, (winning_array, losing_array) in all_year_arrays.items(): 
+            parties = all_year_parties.get(year) if all_year_parties is not None else None
+            previous_weights = [previous[party] for party in parties] if parties is not None and previous and set(parties) == set(previous) else None
+            results[year] = solve_year(year, winning_array, losing_array, options, labels[year], seats[year], previous_weights)
+            if parties is not None: 
+                previous = dict(zip(parties, results[year]['min_weights']))
+        return results
+    by_size = sorted(all_year_arrays, key=lambda year: len(all_year_arrays[year][0]) * len(all_year_arrays[year][1]), reverse=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool: # no previous weights here, the years run at the same time
+        futures = {year: pool.submit(solve_year, year, *all_year_arrays[year], options, labels[year], seats[year]) for year in by_size}
+        return {year: futures[year].result() for year in all_year_arrays}
+
+def type_classes(same_type_pairs, parties):
+    ## takes in the list of same-type pairs of one year (party_types_bitmask) and the parties of the year
+    ## joins the pairs into classes (union-find), returns np.array with the class of every party, classes numbered in party order
+    parent = list(range(len(parties)))
+    index = {party: i for i, party in enumerate(parties)}
+    def root(i): 
+        while parent[i] != i: 
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    for party_a, party_b in same_type_pairs: 
+        a, b = root(index[party_a]), root(index[party_b])
+        parent[max(a, b)] = min(a, b)
+    roots = [root(i) for i in range(len(parties))]
+    numbering = {r: k for k, r in enumerate(dict.fromkeys(roots))}
+    return np.array([numbering[r] for r in roots], dtype=np.int64)
+
+def get_all_type_classes(same_type_dict, parties_in_year):
+    #simple loop, dict with (year, class labels)
+    return {year: type_classes(same_type_dict.get(year, []), parties) for year, parties in parties_in_year.items()}
+
+def reduce_incidence(winning_array, losing_array, labels):
+    ## merges the columns of every type class: entries become the number of class members in the coalition
+    ## returns reduced winning and losing arrays and the class sizes (coefficients of the objective)
+    membership = np.zeros((len(labels), labels.max() + 1), dtype=np.int64)
+    membership[np.arange(len(labels)), labels] = 1
+    return winning_array.astype(np.int64) @ membership, losing_array.astype(np.int64) @ membership, membership.sum(axis=0)
+
+def expand_class_weights(class_weights, labels):
+    ## one weight per class --> one weight per party
+    return np.asarray(class_weights)[labels]
+
 def mvw_to_parties2(all_year_all_weights, parties_in_year):
     ## does what get_all_optimized_seats does but for collect_all_representations lists of weights 
     ## needs some serious polishing 
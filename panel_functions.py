@@ -0,0 +1,175 @@
+import os
+import json
+import glob
+import hashlib
+import pandas as pd
+
+from store_functions import normalize_election_date, read_store, require_pyarrow
+
+## consolidated cross-country panel for r_data: one row per (country, election, party)
+## replaces country_df/update_prelims/update_powerindices of production.ipynb:
+##     every workbook is read once with all its sheets, the dates are normalized with normalize_election_date (no format guessing per date)
+##     and the per-country tables are joined with merge on (country, election, party) instead of filling a wide dataframe with .at
+## sources: the columnar store of getMVWs(store_path=...) or the workbooks in mvws/, prelims/ and powerindices/
+## every country panel is cached (cache_folder/<country>.parquet) with a manifest of its input files (size, mtime, sha256)
+## --> build_panel only re-reads the countries whose inputs changed, the others come from the cache
+
+PANEL_COLUMNS = ['country', 'election', 'parliament', 'party_index', 'party', 'seats', 'n', 'total_seats',
+                 'mvw', 'penrose_banzhaf', 'shapley_shubik', 'minimal_sum']
+
+EXCEL_PREFIXES = {'mvws': 'minimal_seats-', 'prelims': 'Preliminaries-', 'powerindices': 'power_indices-'}
+
+######## Inputs and Manifest #############
+
+def excel_sources(mvws_folder='mvws', prelims_folder='prelims', powerindices_folder='powerindices'):
+    ## dict with (country, dict with (kind, path)), the country is the file name without prefix (i.e. 'Czech-republic')
+    ## only countries with minimal weights are part of the panel (as in country_df)
+    sources = {}
+    for kind, folder in (('mvws', mvws_folder), ('prelims', prelims_folder), ('powerindices', powerindices_folder)):
+        for path in sorted(glob.glob(os.path.join(folder, f'{EXCEL_PREFIXES[kind]}*.xlsx'))):
+            country = os.path.splitext(os.path.basename(path))[0][len(EXCEL_PREFIXES[kind]):]
+            sources.setdefault(country, {})[kind] = path
+    return {country: paths for country, paths in sources.items() if 'mvws' in paths}
+
+def store_sources(store_path):
+    ## same for the columnar store, the inputs of a country are all parquet files of its partitions
+    sources = {}
+    for table in ('parties', 'weights', 'power_indices'):
+        for folder in sorted(glob.glob(os.path.join(store_path, table, 'country=*'))):
+            country = os.path.basename(folder)[len('country='):]
+            files = sorted(glob.glob(os.path.join(folder, '**', '*.parquet'), recursive=True))
+            sources.setdefault(country, {})[table] = files
+    return {country: paths for country, paths in sources.items() if 'weights' in paths}
+
+def file_fingerprint(path, known=None):
+    ## (size, mtime, sha256) of a file, the hash is only computed again if size or mtime differ from the known fingerprint
+    stat = os.stat(path)
+    if known is not None and known[0] == stat.st_size and known[1] == stat.st_mtime:
+        return known
+    with open(path, 'rb') as file:
+        return [stat.st_size, stat.st_mtime, hashlib.sha256(file.read()).hexdigest()]
+
+def input_files(paths):
+    ## flat sorted list of the input files of one country
+    files = []
+    for value in paths.values():
+        files.extend(value if isinstance(value, list) else [value])
+    return sorted(files)
+
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as file:
+        return json.load(file)
+
+def save_manifest(manifest_path, manifest):
+    with open(manifest_path, 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+
+def changed_countries(sources, manifest, source_kind):
+    ## countries whose input files (or their content) differ from the manifest, returns list and the new fingerprints
+    changed = []
+    fingerprints = {}
+    for country, paths in sources.items():
+        entry = manifest.get(country, {})
+        known = entry.get('files', {}) if entry.get('source') == source_kind else {}
+        fingerprints[country] = {path: file_fingerprint(path, known.get(path)) for path in input_files(paths)}
+        ## same files with the same hashes --> unchanged, a new mtime alone (i.e. after a copy) does not trigger a rebuild
+        if {path: value[2] for path, value in fingerprints[country].items()} != {path: value[2] for path, value in known.items()}:
+            changed.append(country)
+    return changed, fingerprints
+
+######## Country Panels #############
+
+def finish_country_panel(df, country):
+    ## common last step of both sources: n, total seats and the parliament label of the notebooks (country + normalized election)
+    df.insert(0, 'country', country)
+    df['parliament'] = df['country'] + df['election']
+    groups = df.groupby('election', sort=False)
+    df['n'] = groups['party'].transform('size')
+    df['seats'] = df['seats'].astype('Int64') # countries without preliminaries have no seats
+    df['total_seats'] = groups['seats'].transform('sum', min_count=1).astype('Int64')
+    for column in ('penrose_banzhaf', 'shapley_shubik', 'minimal_sum'):
+        df[column] = df[column].astype('float64') if column in df else float('nan')
+    return df[PANEL_COLUMNS].astype({'party_index': 'int64', 'n': 'int64', 'mvw': 'int64'}).sort_values(['election', 'party_index'], ignore_index=True)
+
+def normalized(df):
+    ## election labels of the workbooks can be in both YearMonth formats, normalized before any join
+    df['election'] = df['election'].map(normalize_election_date)
+    return df
+
+def country_panel_excel(paths, country):
+    '''panel of one country from its workbooks, every workbook is opened once'''
+    ## mvws: 'Minimal Seats Per Party' with (Key_1, Key_2, Value_1) = (election, party, minimal weight), in party order
+    mvws = pd.read_excel(paths['mvws'], sheet_name='Minimal Seats Per Party').rename(columns={'Key_1': 'election', 'Key_2': 'party', 'Value_1': 'mvw'})
+    df = normalized(mvws[['election', 'party', 'mvw']].copy())
+    df['party_index'] = df.groupby('election', sort=False).cumcount()
+    if 'prelims' in paths: # original seats from 'Transformed Data'
+        seats = pd.read_excel(paths['prelims'], sheet_name='Transformed Data').rename(columns={'YearMonth': 'election', 'Party': 'party', '# of Seats': 'seats'})
+        df = df.merge(normalized(seats[['election', 'party', 'seats']]), on=['election', 'party'], how='left', validate='one_to_one')
+    if 'powerindices' in paths: # one sheet per election (+ 'all representations' of the batched engine, not part of the panel)
+        sheets = pd.read_excel(paths['powerindices'], sheet_name=None)
+        power = pd.concat([sheet.assign(election=name) for name, sheet in sheets.items() if name != 'all representations'], ignore_index=True)
+        power = power.rename(columns={'Party': 'party', 'Penrose-Banzhaf': 'penrose_banzhaf', 'Shapely-Shubik': 'shapley_shubik', 'Minimal-Sum': 'minimal_sum'})
+        df = df.merge(normalized(power[['election', 'party', 'penrose_banzhaf', 'shapley_shubik', 'minimal_sum']]), on=['election', 'party'], how='left', validate='one_to_one')
+    if 'seats' not in df:
+        df['seats'] = pd.NA
+    return finish_country_panel(df, country)
+
+def country_panel_store(store_path, country):
+    '''panel of one country from the columnar store, only its partitions are read'''
+    ## representation 0 of weights/power_indices is the one of optimal_seats (the minimal weights of the workbooks)
+    country_filter = [('country', '=', country)]
+    df = read_store(store_path, 'weights', country_filter + [('representation', '=', 0)], ['election', 'party_index', 'party', 'weight'])
+    df = df.rename(columns={'weight': 'mvw'})
+    seats = read_store(store_path, 'parties', country_filter, ['election', 'party', 'seats'])
+    df = df.merge(seats, on=['election', 'party'], how='left', validate='one_to_one')
+    if os.path.exists(os.path.join(store_path, 'power_indices', f'country={country}')):
+        power = read_store(store_path, 'power_indices', country_filter + [('representation', '=', 0)],
+                           ['election', 'party', 'penrose_banzhaf', 'shapley_shubik', 'minimal_sum'])
+        df = df.merge(power, on=['election', 'party'], how='left', validate='one_to_one')
+    return finish_country_panel(df, country)
+
+######## Main Method #############
+
+def build_panel(output=os.path.join('r_data', 'panel.feather'), store_path=None, mvws_folder='mvws', prelims_folder='prelims',
+                powerindices_folder='powerindices', cache_folder=os.path.join('r_data', 'panel_cache'), rebuild=False):
+    '''main method: all-countries panel as long dataframe (PANEL_COLUMNS), also written to output (.feather, .parquet or .csv)'''
+    ## store_path: read the columnar store instead of the workbooks
+    ## rebuild: ignore the manifest and re-read every country
+    require_pyarrow() # country cache and feather output
+    if not os.path.exists(cache_folder):
+        os.makedirs(cache_folder)
+    source_kind = 'store' if store_path is not None else 'excel'
+    sources = store_sources(store_path) if store_path is not None else excel_sources(mvws_folder, prelims_folder, powerindices_folder)
+    manifest_path = os.path.join(cache_folder, 'manifest.json')
+    manifest = {} if rebuild else load_manifest(manifest_path)
+    changed, fingerprints = changed_countries(sources, manifest, source_kind)
+    panels = []
+    for country in sources:
+        cache_file = os.path.join(cache_folder, f'{country}.parquet')
+        if country in changed or not os.path.exists(cache_file):
+            panel = country_panel_store(store_path, country) if store_path is not None else country_panel_excel(sources[country], country)
+            panel.to_parquet(cache_file, index=False)
+        else:
+            panel = pd.read_parquet(cache_file)
+        manifest[country] = {'source': source_kind, 'files': fingerprints[country]}
+        panels.append(panel)
+    for country in set(manifest) - set(sources): # inputs deleted --> country leaves the panel
+        del manifest[country]
+        if os.path.exists(os.path.join(cache_folder, f'{country}.parquet')):
+            os.remove(os.path.join(cache_folder, f'{country}.parquet'))
+    save_manifest(manifest_path, manifest)
+    panel = pd.concat(panels, ignore_index=True) if panels else pd.DataFrame(columns=PANEL_COLUMNS)
+    panel = panel.sort_values(['country', 'election', 'party_index'], ignore_index=True)
+    if output is not None:
+        folder = os.path.dirname(output)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        if output.endswith('.csv'):
+            panel.to_csv(output, index=False)
+        elif output.endswith('.parquet'):
+            panel.to_parquet(output, index=False)
+        else:
+            panel.reset_index(drop=True).to_feather(output)
+    return panel
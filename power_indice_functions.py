@@ -3,6 +3,9 @@ import numpy as np
 import math
 from math import factorial
 import time 
+from scipy import stats
+
+from mwc_functions import winning_threshold
 
 ## these functions follow the logic of the "The Coleman-Shapley-index: Being decisive within the coalition of the interested" Paper, especially Appendix A. 
 ## this is a rebuild of the ssi and pbi generating functions from "powerindices" which can be pip installed
@@ -57,6 +60,7 @@ def coals(W,Q,q,n):
     return M
 
 def coals_with_i(w_i,Q,q,n,M,i): 
+    '''outdated method - python double loop, use coals_with_i_vectorized'''
     '''input: passed'''
     '''output: M as an np.array of dim(Q+1,n+1) where M[x][y] stores how many winning coalitions including i exist with weight=x and #(coal)=y'''
     ## similar to number_coalitions_weighting_x_having_size_s_including_i
@@ -68,15 +72,40 @@ def coals_with_i(w_i,Q,q,n,M,i):
         for col in range(n-1,-1,-1): #iterate backwards though relevant cols 
             M_only_i[row,col]=M[row,col]-M_only_i[row+w_i,col+1] #dynamically iterate 
     return M_only_i
+def coals_with_i_vectorized(w_i,Q,q,n,M,i,chunk_rows=65536): 
+    '''same output as coals_with_i with whole-array numpy operations'''
+    ## unrolling M_only_i[row,col]=M[row,col]-M_only_i[row+w_i,col+1] gives an alternating sum along the diagonal: 
+    ##     M_only_i[row,col] = sum_k (-1)^k * M[row+k*w_i,col+k], at most n+1 terms since col+k<=n (rows above Q are 0)
+    ## --> n+1 shifted slices of M added up, also covers the copied top rows (row+w_i>Q) and w_i=0 
+    ## rows below min(q,Q-w_i+1) stay 0 just like in the loop; rows are processed in chunks of chunk_rows so the temporaries stay small for huge Q
+    ## integer sums are exact (even wrapping int64 gives the same result as the loop)
+    M_only_i = np.zeros((Q+1,n+1),dtype=np.int64)
+    start = min(q,Q-w_i+1)
+    for a in range(start,Q+1,chunk_rows): 
+        b = min(a+chunk_rows,Q+1)
+        for k in range(n+1): 
+            lo = a+k*w_i
+            if lo>Q: 
+                break
+            hi = min(b+k*w_i,Q+1)
+            target = M_only_i[a:a+hi-lo,:n+1-k]
+            if k%2==0: 
+                target += M[lo:hi,k:]
+            else: 
+                target -= M[lo:hi,k:]
+    return M_only_i
+
 ##power indices:             
-def pb_and_ss_i(weights,min_cardinality):
+def pb_and_ss_i(weights,min_cardinality,quota=0.5):
     '''input: list of integer weights and integer listing the number of players in the shortest winning coalition'''
     '''ouput: tuple of lists, first list are penrose-banzaf index values, second list are shapely-shuib index values '''
     # merger of compute_pbi and compute_ssi functions from 'powerindices', variable names are aligned with my thesis, some improvements to readability 
+    ## quota: share of the weights to exceed, q=Q//2+1 for the simple majority 
+    ##     (was round((Q+1)/2), which rounds half to even and gave q=Q/2 whenever Q is divisible by 4)
     ## variables
     W= np.array(weights)
     Q=sum(W)
-    q=round((Q+1)/2) 
+    q=winning_threshold(Q,quota) 
     n=len(weights)
     ## penrose banzhaf
     pb_scaling_factor = (1/2)**(n-1)
@@ -90,20 +119,48 @@ def pb_and_ss_i(weights,min_cardinality):
     ## get individual values
     for i in range(n):
         w_i=W[i]
-        M_only_i= coals_with_i(w_i,Q,q,n,M,i)  
-        pb_counter = 0
-        ss_counter = 0 
-        for cols in range(min_cardinality-1,n): 
-            pb_counter+= M_only_i[q:q+w_i,cols+1].sum(axis=0)
-            ss_counter+= shapely_values[cols]*M_only_i[q:q+w_i,cols+1].sum(axis=0)
-        ss_counter+=shapely_values[min_cardinality-1]*M_only_i[q+w_i:Q+1,min_cardinality].sum(axis=0)
+        M_only_i= coals_with_i_vectorized(w_i,Q,q,n,M,i)  
+        pb_counter,ss_counter = read_pb_and_ss(M_only_i,w_i,Q,q,n,min_cardinality,shapely_values)
         ss_list.append(ss_counter)    
-        pb_counter+= M_only_i[q+w_i:Q+1,min_cardinality].sum(axis=0)
-        pb_counter= pb_counter*pb_scaling_factor
-        pb_list.append(pb_counter)
+        pb_list.append(pb_counter*pb_scaling_factor)
         
     return pb_list,ss_list
 
+def read_pb_and_ss(M_only_i,w_i,Q,q,n,min_cardinality,shapely_values): 
+    '''helper function for pb_and_ss_i and pb_and_ss_quotas: unscaled pb counter and ss counter of one player at quota q'''
+    pb_counter = 0
+    ss_counter = 0 
+    for cols in range(min_cardinality-1,n): 
+        pb_counter+= M_only_i[q:q+w_i,cols+1].sum(axis=0)
+        ss_counter+= shapely_values[cols]*M_only_i[q:q+w_i,cols+1].sum(axis=0)
+    ss_counter+=shapely_values[min_cardinality-1]*M_only_i[q+w_i:Q+1,min_cardinality].sum(axis=0)
+    pb_counter+= M_only_i[q+w_i:Q+1,min_cardinality].sum(axis=0)
+    return pb_counter,ss_counter
+
+def pb_and_ss_quotas(weights,quotas): 
+    '''pb_and_ss_i for several quotas in one pass'''
+    '''output: dict with (quota, (pb_list, ss_list))'''
+    ## the rows of M and M_only_i at and above a quota row never depend on lower rows 
+    ## --> both are built once for the lowest threshold, every other quota only reads its own rows
+    ## the min cardinality of every quota is read from M as well (smallest size with a coalition at or above the threshold)
+    W= np.array(weights)
+    Q=sum(W)
+    n=len(weights)
+    thresholds = {quota: winning_threshold(Q,quota) for quota in quotas}
+    q_min = min(thresholds.values())
+    pb_scaling_factor = (1/2)**(n-1)
+    shapely_values = [ (factorial(C)*factorial(n-C-1))/factorial(n) for C in range(n) ]
+    M = coals(W,Q,q_min,n)
+    min_cardinalities = {quota: int(np.flatnonzero(M[q:Q+1].sum(axis=0))[0]) if q<=Q else n for quota,q in thresholds.items()}
+    results = {quota: ([],[]) for quota in quotas}
+    for i in range(n): 
+        M_only_i = coals_with_i_vectorized(W[i],Q,q_min,n,M,i)
+        for quota,q in thresholds.items(): 
+            pb_counter,ss_counter = read_pb_and_ss(M_only_i,W[i],Q,q,n,max(min_cardinalities[quota],1),shapely_values)
+            results[quota][0].append(pb_counter*pb_scaling_factor)
+            results[quota][1].append(ss_counter)
+    return results
+
 def msr_index_i(weights_dict):
     '''input: weights dict of one year'''
     '''outputs: Min-Sum-Rep Index as array'''
@@ -133,7 +190,7 @@ def combine_names_and_indices(weights_dict,pb_list,ss_list,msr_list):
 
     return df 
 
-def power_indices_year(optimal_seats,minimal_winning_coal_dict,year): 
+def power_indices_year(optimal_seats,minimal_winning_coal_dict,year,quota=0.5): 
     '''main method to get power indices '''
     '''input: optimal_seats_dict of form ((year,party),seats) and minimal_winning_coal_dict of form ((year,coal),1); year as string '''
     '''output: dataframe '''
@@ -143,15 +200,251 @@ def power_indices_year(optimal_seats,minimal_winning_coal_dict,year):
     min_win_coals = minimal_winning_coalitions_for_a_year(minimal_winning_coal_dict,year)
     min_len=mincardinality(min_win_coals)
     ## get bs and ss 
-    pb_list,ss_list = pb_and_ss_i(weights,min_len)
+    pb_list,ss_list = pb_and_ss_i(weights,min_len,quota)
     ## get minimal sum representation index
     msr_list=msr_index_i(weights_dict)
     df=combine_names_and_indices(weights_dict,pb_list,ss_list,msr_list)
     return df
 
-def get_power_indices(optimal_seats,minimal_winning_coal_dict): 
+def get_power_indices(optimal_seats,minimal_winning_coal_dict,quota=0.5): 
+    '''outdated method - recomputes every year once per party, use get_power_indices_batched'''
     all_power_indices_dict = {}
     for (year,party),seats in optimal_seats.items():
-        df=power_indices_year(optimal_seats,minimal_winning_coal_dict,year)
+        df=power_indices_year(optimal_seats,minimal_winning_coal_dict,year,quota)
         all_power_indices_dict[year]=df
-    return all_power_indices_dict
\ No newline at end of file
+    return all_power_indices_dict
+
+## batched engine: one pass over the dicts, every distinct weight vector computed once, all alternative representations 
+
+def group_weights_by_year(optimal_seats): 
+    '''input: optimal_seats_dict of form ((year,party),seats or tuple of seats)'''
+    '''output: dict with (year, (list of parties, np.array of dim(#representations,n))), row k holds the k-th value of every tuple'''
+    parties = {}
+    values = {}
+    for (year,party),seats in optimal_seats.items(): 
+        parties.setdefault(year,[]).append(party)
+        values.setdefault(year,[]).append(seats if isinstance(seats,tuple) else (seats,))
+    return {year: (parties[year], np.array(values[year],dtype=np.int64).T) for year in parties}
+
+def min_cardinality_by_year(minimal_winning_coal_dict): 
+    ## mincardinality for all years in one pass over the dict, the smallest winning coal is a property of the game, not of the weights
+    min_cardinalities = {}
+    for (year,coal),_ in minimal_winning_coal_dict.items(): 
+        size = len(coal.split('+'))
+        min_cardinalities[year] = min(size,min_cardinalities.get(year,size))
+    return min_cardinalities
+
+def pb_and_ss_cached(weights,min_cardinality,computed,quota=0.5): 
+    ## pb_and_ss_i for weights sorted largest first, results are permuted back to the party order 
+    ## computed: dict with (sorted weights, min_cardinality, quota) --> (pb,ss,info), shared over all years so equal games are computed once
+    ## games too large for the int64 table (needs_large_mode) go through power_indices_large(mode='auto') instead
+    ## returns pb_list, ss_list and the info dict of power_indices_large (mode 'int64' and no error for the usual games)
+    order = np.argsort(-weights,kind='stable')
+    key = (tuple(weights[order].tolist()),min_cardinality,str(quota))
+    if key not in computed: 
+        if needs_large_mode(weights): 
+            computed[key] = power_indices_large(weights[order],min_cardinality,winning_threshold(int(weights.sum()),quota),mode='auto')
+        else: 
+            pb_sorted,ss_sorted = pb_and_ss_i(weights[order],min_cardinality,quota)
+            computed[key] = (pb_sorted,ss_sorted,{'mode':'int64','pb_error':np.zeros(len(weights)),'ss_error':np.zeros(len(weights))})
+    pb_sorted,ss_sorted,info = computed[key]
+    pb_list = [None]*len(weights)
+    ss_list = [None]*len(weights)
+    pb_error = np.zeros(len(weights))
+    ss_error = np.zeros(len(weights))
+    for k,i in enumerate(order): 
+        pb_list[i] = pb_sorted[k]
+        ss_list[i] = ss_sorted[k]
+        pb_error[i] = info['pb_error'][k]
+        ss_error[i] = info['ss_error'][k]
+    return pb_list,ss_list,{**info,'pb_error':pb_error,'ss_error':ss_error}
+
+def needs_large_mode(weights,table_limit=5*10**7): 
+    ## the int64 table of pb_and_ss_i overflows for n>60 (2^n coalitions) and gets too big above table_limit cells
+    n = len(weights)
+    return n>60 or (int(np.sum(weights))+1)*(n+1)>table_limit
+
+def get_power_indices_batched(optimal_seats,minimal_winning_coal_dict,quota=0.5): 
+    '''main method of the batched engine'''
+    '''input: same as get_power_indices'''
+    '''output: dict with (year, dataframe) exactly like get_power_indices (first representation, Minimal-Sum of the mean weights) and 
+    a long dataframe with one row per year, representation and party'''
+    ## the long dataframe also holds the mode of power_indices_large and the error bounds, non-zero only for sampled games (n>60 or huge totals)
+    grouped = group_weights_by_year(optimal_seats)
+    min_cardinalities = min_cardinality_by_year(minimal_winning_coal_dict)
+    computed = {}
+    all_power_indices_dict = {}
+    rows = []
+    for year,(parties,representations) in grouped.items(): 
+        for k,weights in enumerate(representations): 
+            pb_list,ss_list,info = pb_and_ss_cached(weights,min_cardinalities[year],computed,quota)
+            msr_list = weights/weights.sum()
+            rows.extend(zip([year]*len(parties),[k]*len(parties),parties,weights.tolist(),pb_list,ss_list,msr_list,
+                            [info['mode']]*len(parties),info['pb_error'],info['ss_error']))
+            if k==0: 
+                first_pb,first_ss = pb_list,ss_list
+        msr_list = representations.mean(axis=0)/representations.mean(axis=0).sum() # msr_index_i averages the tuples
+        all_power_indices_dict[year] = pd.DataFrame(list(zip(parties,first_pb,first_ss,msr_list)),columns=['Party','Penrose-Banzhaf','Shapely-Shubik','Minimal-Sum'])
+    long_df = pd.DataFrame(rows,columns=['Year','Representation','Party','Weight','Penrose-Banzhaf','Shapely-Shubik','Minimal-Sum','Mode','PB error','SS error'])
+    return all_power_indices_dict,long_df
+
+
+## full count tables for what-if questions (whatif_class.py) 
+## C[x,s] = number of coalitions with weight x and s members, over all x (not only the winning rows like coals), i.e. the coefficients of prod_i (1+y*z^w_i)
+## the table does not depend on the quota, so quota shifts only read other rows
+## adding a player multiplies by (1+y*z^w), removing it divides by it again (deconvolution) --> O(Q*n) per changed player instead of rebuilding
+
+def full_count_table(weights): 
+    '''input: integer weights'''
+    '''output: np.array of dim(sum(weights)+1,n+1) with C[x,s] as above'''
+    C = np.zeros((1,1),dtype=np.int64)
+    C[0,0] = 1 # empty coalition
+    for w in weights: 
+        C = add_player_to_table(C,int(w))
+    return C
+
+def add_player_to_table(C,w,truncated=False): 
+    ## multiplication by (1+y*z^w): table gets w more rows and one more column
+    ## truncated: keeps the number of rows, i.e. only the coalitions lighter than the quota (all that is needed for the swings)
+    ## keeps the dtype of C (int64, or object for python integers that never overflow)
+    rows = C.shape[0] if truncated else C.shape[0]+w
+    added = np.zeros((rows,C.shape[1]+1),dtype=C.dtype)
+    added[:C.shape[0],:C.shape[1]] = C
+    if w<rows: 
+        added[w:,1:] += C[:rows-w]
+    return added
+
+def remove_player_from_table(C,w,truncated=False): 
+    ## division by (1+y*z^w): solves C[x,s] = R[x,s] + R[x-w,s-1] for R, going up in x
+    ## rows only depend on rows w below --> blocks of w rows at once, or for small w the unrolled alternating sum R[x,s] = sum_k (-1)^k C[x-k*w,s-k] (at most n terms)
+    ## truncated: C only holds the lightest rows (add_player_to_table(...,truncated=True)), R keeps all of them
+    rows, cols = (C.shape[0] if truncated else C.shape[0]-w), C.shape[1]-1
+    if w==0 or cols < rows/w: # unrolled sum: cols vectorized steps
+        R = np.zeros((rows,cols),dtype=C.dtype)
+        for k in range(cols): 
+            if k*w>=rows: 
+                break
+            if k%2==0: 
+                R[k*w:,k:] += C[:rows-k*w,:cols-k]
+            else: 
+                R[k*w:,k:] -= C[:rows-k*w,:cols-k]
+        return R
+    R = C[:rows,:cols].copy() # blocks of w rows: rows/w vectorized steps
+    for start in range(w,rows,w): 
+        stop = min(start+w,rows)
+        R[start:stop,1:] -= R[start-w:stop-w,:cols-1]
+    return R
+
+def quota_from_share(Q,share=0.5): 
+    ## smallest weight with more than share*Q, the strict majority Q//2+1 for share=1/2
+    return winning_threshold(Q,share)
+
+def power_of_player(C_others,w_i,q,n): 
+    '''input: count table without player i, weight of i, quota and number of players incl. i'''
+    '''output: penrose-banzhaf and shapely-shubik value of i'''
+    ## i is decisive for the coalitions S of the others with q-w_i <= w(S) < q, O(Q*n)
+    swing = C_others[max(q-w_i,0):min(q,C_others.shape[0]),:]
+    pb = swing.sum()*(1/2)**(n-1)
+    sizes = np.arange(C_others.shape[1])
+    shapely_values = np.array([factorial(s)*factorial(n-s-1)/factorial(n) for s in sizes])
+    ss = float((swing.sum(axis=0)*shapely_values).sum())
+    return pb,ss
+
+def power_from_table(C,weights,q): 
+    ## all players from one full table: remove every player once, O(n*Q*n)
+    ## returns pb_list,ss_list like pb_and_ss_i
+    pb_list,ss_list = [],[]
+    for w_i in weights: 
+        pb,ss = power_of_player(remove_player_from_table(C,int(w_i)),int(w_i),q,len(weights))
+        pb_list.append(pb)
+        ss_list.append(ss)
+    return pb_list,ss_list
+
+
+## large assemblies: pb_and_ss_i needs a dense (Q+1)x(n+1) int64 table and its counts overflow for n above ~60
+## power_indices_large picks the mode from n and Q: 
+##     'int64'    pb_and_ss_i as it is (n<=60, small table)
+##     'exact'    python integers (never overflow) in a table truncated at the quota, every distinct weight is removed once
+##     'sampling' stratified sampling with confidence intervals: pb by random coalitions, ss by cyclic permutations
+
+def power_of_player_exact(C_others,w_i,q,n): 
+    ## power_of_player with exact integer sums, the float division is the last step (no (1/2)**(n-1) or n! as float)
+    swing = C_others[max(q-w_i,0):min(q,C_others.shape[0]),:].sum(axis=0)
+    pb = int(swing.sum())/2**(n-1)
+    ss = sum(int(count)*factorial(s)*factorial(n-s-1) for s,count in enumerate(swing))/factorial(n)
+    return pb,ss
+
+def pb_and_ss_exact(weights,q): 
+    ## exact indices from one truncated table of python integers, players with equal weight share their values
+    n = len(weights)
+    C = np.zeros((q,1),dtype=object)
+    C[0,0] = 1
+    for w in weights: 
+        C = add_player_to_table(C,int(w),truncated=True)
+    values = {w: power_of_player_exact(remove_player_from_table(C,w,truncated=True),w,q,n) for w in set(int(w) for w in weights)}
+    return [values[int(w)][0] for w in weights],[values[int(w)][1] for w in weights]
+
+def pb_sampling(weights,q,samples,rng): 
+    ## random coalitions of all players (everyone joins with prob. 1/2), i is a swing if the others hold q-w_i <= w(S\i) < q
+    ## returns estimates and their standard errors
+    n = len(weights)
+    hits = np.zeros(n)
+    for start in range(0,samples,max(1,2**22//max(n,1))): # bounded batches of coalitions
+        batch = min(max(1,2**22//max(n,1)),samples-start)
+        members = rng.random((batch,n))<0.5
+        totals = members@weights
+        others = totals[:,None]-members*weights
+        hits += ((others>=q-weights)&(others<q)).sum(axis=0)
+    pb = hits/samples
+    return pb,np.sqrt(pb*(1-pb)/samples)
+
+def ss_sampling(weights,q,permutations,rng): 
+    ## cyclic permutation sampling: every rotation of a random permutation has exactly one pivotal player (the one crossing q)
+    ## the n rotations put every player once on every position --> stratified by position, the estimate of a permutation is (#pivotal)/n
+    ## returns estimates and their standard errors (over the permutations)
+    n = len(weights)
+    pivotal = np.zeros((permutations,n))
+    for p in range(permutations): 
+        order = rng.permutation(n)
+        cumulative = np.concatenate([[0],np.cumsum(np.concatenate([weights[order],weights[order]]))])
+        crossing = np.searchsorted(cumulative,cumulative[:n]+q,side='left')-1 # position in the doubled order where rotation r reaches q
+        valid = crossing<np.arange(n)+n # rotation can reach q at all
+        np.add.at(pivotal[p],order[crossing[valid]%n],1)
+    estimates = pivotal/n
+    return estimates.mean(axis=0),estimates.std(axis=0,ddof=1)/np.sqrt(permutations) if permutations>1 else np.full(n,np.inf)
+
+def power_indices_large(weights,min_cardinality=1,quota=None,mode='auto',samples=10000,permutations=1000,confidence=0.95,seed=None,
+                        table_limit=5*10**7,exact_limit=2*10**7): 
+    '''pb_and_ss_i for assemblies of any size'''
+    '''output: pb_list, ss_list and a dict with the mode and the half-width of the confidence interval of every value (0 for exact modes)'''
+    ## quota: winning weight, Q//2+1 (rule of pb_and_ss_i) if None
+    ## table_limit: max cells of the dense int64 table of pb_and_ss_i, exact_limit: max python integer operations of the exact mode
+    W = np.array(weights,dtype=np.int64)
+    Q = int(W.sum())
+    n = len(W)
+    q = quota if quota is not None else winning_threshold(Q)
+    if mode=='auto': 
+        distinct = len(set(W.tolist()))
+        if n<=60 and (Q+1)*(n+1)<=table_limit and quota is None: 
+            mode = 'int64'
+        elif q*(n+1)*(n+distinct)<=exact_limit: 
+            mode = 'exact'
+        else: 
+            mode = 'sampling'
+    info = {'mode':mode,'confidence':confidence}
+    if mode=='int64': 
+        pb_list,ss_list = pb_and_ss_i(W,min_cardinality)
+        info.update({'pb_error':np.zeros(n),'ss_error':np.zeros(n)})
+    elif mode=='exact': 
+        pb_list,ss_list = pb_and_ss_exact(W,q)
+        info.update({'pb_error':np.zeros(n),'ss_error':np.zeros(n)})
+    elif mode=='sampling': 
+        rng = np.random.default_rng(seed)
+        z = float(stats.norm.ppf((1+confidence)/2))
+        pb,pb_se = pb_sampling(W,q,samples,rng)
+        ss,ss_se = ss_sampling(W,q,permutations,rng)
+        pb_list,ss_list = list(pb),list(ss)
+        info.update({'pb_error':z*pb_se,'ss_error':z*ss_se,'samples':samples,'permutations':permutations})
+    else: 
+        raise ValueError(f"unknown mode {mode}, use 'auto', 'int64', 'exact' or 'sampling'")
+    return pb_list,ss_list,info
@@ -0,0 +1,182 @@
+import time
+import numpy as np
+import pandas as pd
+
+from mwc_functions import minimal_coalitions_dfs, coalition_order, mask_to_coal, winning_threshold, quota_fraction
+from optimization_functions import masks_to_incidence, generate_sparse_cons, get_lin_cons, get_min_vote_weights, quota_rows
+from power_indice_functions import pb_and_ss_i
+from cache_functions import canonical_game, open_game_cache, cache_lookup, cache_store
+
+## monte carlo simulation of election uncertainty for one parliament
+## seat vectors are drawn as one numpy batch, samples are reduced to their canonical game (cache_functions)
+## --> the milp and the power indices only run once per distinct game, all samples of that game share the results
+## samples with the same seats sorted largest first always are the same game, so the mwc search also runs only once per sorted seat vector
+
+def largest_remainder(shares, total_seats):
+    ## hare/largest remainder apportionment of total_seats for every row of shares (rows add up to 1)
+    quotas = shares * total_seats
+    seats = np.floor(quotas).astype(np.int64)
+    remaining = total_seats - seats.sum(axis=1)
+    rank = np.argsort(np.argsort(-(quotas - seats), axis=1, kind='stable'), axis=1) # 0 for the largest remainder
+    return seats + (rank < remaining[:, None])
+
+def draw_seats(seats, n_samples, model='dirichlet', concentration=1000, sd=2.0, seed=None):
+    '''n_samples perturbed seat vectors as np.array of dim(n_samples,n)'''
+    ## 'dirichlet': vote shares ~ Dirichlet(concentration * seat shares), i.e. polling uncertainty of roughly concentration respondents,
+    ##     seats by largest remainder, total stays the same
+    ## 'multinomial': every seat is allocated at random with the seat shares, total stays the same
+    ## 'normal': every party gets round(N(0,sd)) seats more or less (not below 0), the total changes, samples without any seat are drawn again
+    rng = np.random.default_rng(seed)
+    seats = np.asarray(seats, dtype=np.int64)
+    total = int(seats.sum())
+    shares = seats / total
+    if model == 'dirichlet':
+        alpha = np.maximum(concentration * shares, 1e-3) # parties with 0 seats stay (almost) at 0
+        return largest_remainder(rng.dirichlet(alpha, n_samples), total)
+    if model == 'multinomial':
+        return rng.multinomial(total, shares, n_samples).astype(np.int64)
+    if model == 'normal':
+        if total == 0:
+            raise ValueError("seats add up to 0, there is nothing to perturb")
+        samples = np.maximum(seats + np.round(rng.normal(0, sd, (n_samples, len(seats)))), 0).astype(np.int64)
+        empty = samples.sum(axis=1) == 0
+        while empty.any(): # parliaments without any seat are no game, these samples are drawn again
+            samples[empty] = np.maximum(seats + np.round(rng.normal(0, sd, (int(empty.sum()), len(seats)))), 0).astype(np.int64)
+            empty = samples.sum(axis=1) == 0
+        return samples
+    raise ValueError(f"unknown model {model}, use 'dirichlet', 'multinomial' or 'normal'")
+
+def solve_canonical_game(sorted_seats, win_masks, quota=0.5):
+    ## minimal integer weights and power indices of one game, seats sorted largest first (i.e. already in canonical order)
+    ## same steps as the getMVWs pipeline: incidence arrays --> sparse constraints (+ quota_rows) --> milp --> pb_and_ss_i
+    n = len(sorted_seats)
+    total = int(sum(sorted_seats))
+    grand_coalition = (1 << n) - 1
+    lose_masks = grand_coalition ^ minimal_coalitions_dfs(sorted_seats, total - winning_threshold(total, quota) + 1)
+    winning_array = masks_to_incidence(win_masks, n)
+    losing_array = masks_to_incidence(lose_masks, n)
+    constraints = generate_sparse_cons(winning_array, losing_array)
+    extra_rows = quota_rows(winning_array, losing_array, quota)
+    mvw = get_min_vote_weights(0, {0: n}, get_lin_cons(constraints, extra_rows))
+    if mvw.x is None: # infeasible or failed milp, no weights to round
+        raise RuntimeError(f"seats {list(sorted_seats)}, milp failed: {mvw.message}")
+    weights = np.round(mvw.x).astype(np.int64)
+    min_cardinality = int(winning_array.sum(axis=1).min())
+    pb_list, ss_list = pb_and_ss_i(weights, min_cardinality, quota)
+    return {'weights': weights.tolist(), 'power': {'pb': [float(v) for v in pb_list], 'ss': [float(v) for v in ss_list]}}
+
+def quota_variant(quota=0.5):
+    ## part of the canonical key: the game does not depend on the quota, but the stored weights (quota_rows) and power indices do
+    return '' if quota_fraction(quota) == quota_fraction(0.5) else f'quota={quota_fraction(quota)}'
+
+def simulate_games(samples, cache_path=None, quota=0.5):
+    '''samples: np.array of dim(n_samples,n) with seat vectors of the same parties'''
+    '''output: dict with game keys per sample, party orders per sample, the game results (canonical order) and stats'''
+    ## games already in the persistent cache (cache_path) are not solved again either
+    ## samples without any seat get the key 'empty' (weights and indices 0) and are counted in stats['empty']
+    start = time.time()
+    order = np.argsort(-samples, axis=1, kind='stable') # canonical position k of sample s is party order[s,k]
+    sorted_samples = np.take_along_axis(samples, order, axis=1)
+    unique_sorted, inverse = np.unique(sorted_samples, axis=0, return_inverse=True)
+    conn = open_game_cache(cache_path) if cache_path is not None else None
+    games = {}
+    keys = []
+    win_masks = {}
+    solved = 0
+    for sorted_seats in unique_sorted:
+        total = int(sorted_seats.sum())
+        if total == 0: # empty parliament (only possible for samples passed in directly): no milp, all weights and indices 0
+            keys.append('empty')
+            if 'empty' not in games:
+                games['empty'] = {'weights': [0] * len(sorted_seats), 'power': {'pb': [0.0] * len(sorted_seats), 'ss': [0.0] * len(sorted_seats)}}
+                win_masks['empty'] = []
+            continue
+        masks = coalition_order(minimal_coalitions_dfs(sorted_seats, winning_threshold(total, quota)), len(sorted_seats))
+        key, _ = canonical_game(masks, sorted_seats, quota_variant(quota))
+        keys.append(key)
+        if key in games:
+            continue
+        win_masks[key] = masks
+        entry = cache_lookup(conn, key) if conn is not None else None
+        if entry is not None and entry['weights'] is not None and entry['power'] is not None:
+            games[key] = {'weights': entry['weights'], 'power': entry['power']}
+            continue
+        games[key] = solve_canonical_game(sorted_seats, masks, quota)
+        solved += 1
+        if conn is not None:
+            cache_store(conn, key, len(sorted_seats), weights=games[key]['weights'], power=games[key]['power'])
+    if conn is not None:
+        conn.close()
+    sample_keys = np.array(keys)[inverse.ravel()]
+    stats = {'samples': len(samples), 'sorted_seat_vectors': len(unique_sorted), 'games': len(games), 'solved': solved,
+             'empty': int((samples.sum(axis=1) == 0).sum()),
+             'seconds': time.time() - start}
+    return {'keys': sample_keys, 'order': order, 'games': games, 'win_masks': win_masks, 'stats': stats}
+
+def to_party_order(simulation, field, index=None):
+    ## np.array of dim(n_samples,n) with a canonical per-game result mapped back to the parties of every sample
+    ## field: 'weights' or 'pb'/'ss' (power)
+    key_list = list(simulation['games'])
+    key_id = {key: i for i, key in enumerate(key_list)}
+    table = np.array([simulation['games'][key]['weights'] if field == 'weights' else simulation['games'][key]['power'][field] for key in key_list])
+    canonical = table[np.array([key_id[key] for key in simulation['keys']])]
+    result = np.empty_like(canonical)
+    np.put_along_axis(result, simulation['order'], canonical, axis=1)
+    return result
+
+def aggregate_simulation(simulation, parties, base_key=None, quantiles=(0.05, 0.5, 0.95)):
+    '''frequency tables of a simulate_games result'''
+    ## games: one row per distinct game with its number of samples, frequency and canonical weights (base: the game of the real seats)
+    ## parties: mean, sd and quantiles of minimal weight, pb and ss per party, and how often the minimal weight differs from the base game
+    ## weights: frequency of every minimal weight value per party
+    ## mwcs: frequency of every minimal winning coalition (in the party names)
+    n_samples = len(simulation['keys'])
+    key_counts = pd.Series(simulation['keys']).value_counts()
+    games = pd.DataFrame({'Game': key_counts.index, 'Samples': key_counts.values, 'Frequency': key_counts.values / n_samples,
+                          'Weights (sorted)': [simulation['games'][key]['weights'] for key in key_counts.index],
+                          'MWCs': [len(simulation['win_masks'][key]) for key in key_counts.index]})
+    games['Base'] = games['Game'] == base_key
+    party_values = {name: to_party_order(simulation, field) for name, field in
+                    (('Weight', 'weights'), ('Penrose-Banzhaf', 'pb'), ('Shapely-Shubik', 'ss'))}
+    rows = []
+    for i, party in enumerate(parties):
+        row = {'Party': party}
+        for name, values in party_values.items():
+            row[f'{name} mean'] = values[:, i].mean()
+            row[f'{name} sd'] = values[:, i].std()
+            for quantile in quantiles:
+                row[f'{name} q{quantile:g}'] = np.quantile(values[:, i], quantile)
+        rows.append(row)
+    party_table = pd.DataFrame(rows)
+    if base_key in simulation['games']:
+        base_samples = np.flatnonzero(simulation['keys'] == base_key)
+        base_weights = party_values['Weight'][base_samples[0]]
+        party_table['Weight changed'] = (party_values['Weight'] != base_weights).mean(axis=0)
+    weight_values = pd.DataFrame(party_values['Weight'], columns=parties).melt(var_name='Party', value_name='Weight')
+    weights = weight_values.value_counts().rename('Samples').reset_index()
+    weights['Frequency'] = weights['Samples'] / n_samples
+    ## mwcs: canonical masks of every game mapped back once per distinct (game, party order) pair
+    pairs, pair_counts = np.unique(np.column_stack([pd.factorize(simulation['keys'])[0], simulation['order']]), axis=0, return_counts=True)
+    key_list = pd.factorize(simulation['keys'])[1]
+    mwc_counts = {}
+    for pair, count in zip(pairs, pair_counts):
+        for mask in simulation['win_masks'][key_list[pair[0]]]:
+            party_mask = sum(1 << int(pair[1 + k]) for k in range(len(parties)) if (int(mask) >> k) & 1)
+            mwc_counts[party_mask] = mwc_counts.get(party_mask, 0) + int(count)
+    mwcs = pd.DataFrame({'Coalition': [mask_to_coal(mask, parties) for mask in mwc_counts], 'Samples': list(mwc_counts.values())})
+    mwcs['Frequency'] = mwcs['Samples'] / n_samples
+    return {'games': games, 'parties': party_table,
+            'weights': weights.sort_values(['Party', 'Weight'], ignore_index=True),
+            'mwcs': mwcs.sort_values('Samples', ascending=False, ignore_index=True)}
+
+def simulate_parliament(seats, parties, n_samples=10000, model='dirichlet', concentration=1000, sd=2.0, seed=None, cache_path=None, quota=0.5):
+    '''main method: draws n_samples seat vectors around seats and returns the frequency tables of aggregate_simulation and the stats'''
+    samples = draw_seats(seats, n_samples, model, concentration, sd, seed)
+    simulation = simulate_games(samples, cache_path, quota)
+    seats = np.asarray(seats, dtype=np.int64)
+    sorted_seats = seats[np.argsort(-seats, kind='stable')]
+    base_masks = minimal_coalitions_dfs(sorted_seats, winning_threshold(int(seats.sum()), quota))
+    base_key, _ = canonical_game(coalition_order(base_masks, len(seats)), sorted_seats, quota_variant(quota))
+    tables = aggregate_simulation(simulation, list(parties), base_key)
+    tables['stats'] = simulation['stats']
+    return tables
@@ -0,0 +1,165 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+
+try: # optional, only needed for the columnar store (pip install pyarrow)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from mwc_functions import mask_to_coal
+
+## columnar result store: one parquet dataset per table, partitioned by country and election (hive layout: table/country=x/election=y/)
+## replaces the per-country excel workbooks, has no row limit (full 2^n tables for n>=20) and keeps typed columns
+## tables:
+##     parties          country, election, party_index, party, seats
+##     coalitions       country, election, mask, seats, winning              (full 2^n tables, only years with a table)
+##     minimal_winning  country, election, mask, coalition
+##     maximal_losing   country, election, mask, coalition
+##     weights          country, election, representation, party_index, party, weight
+##     power_indices    country, election, representation, party, weight, penrose_banzhaf, shapley_shubik, minimal_sum, mode, pb_error, ss_error
+## read_store passes filters to pyarrow, so only matching partitions/row groups are read (predicate pushdown)
+## manifest/<country>.json: content hash of every completed election (incremental mode of getMVWs), see year_hashes,
+## with the errors (verify_found_miw) and crit_cases (verify_types) of the election
+
+TABLES = ['parties', 'coalitions', 'minimal_winning', 'maximal_losing', 'weights', 'power_indices']
+
+MONTHS = {month: i + 1 for i, month in enumerate(['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'])}
+
+def normalize_election_date(label):
+    ## YearMonth labels of transform_and_sort_dataframe are 'YYYY-MM' or, where the date parsing failed, the last 7 characters of the date (i.e. '-Oct-94')
+    ## returns 'YYYY-MM' for both, other labels are returned unchanged
+    label = str(label).strip()
+    if re.fullmatch(r'\d{4}-\d{2}', label):
+        return label
+    match = re.search(r'([A-Za-z]{3})[a-z]*[-. ]+(\d{2}|\d{4})$', label)
+    if match and match.group(1).lower() in MONTHS:
+        year = int(match.group(2))
+        if year < 100:
+            year += 1900 if year > 50 else 2000
+        return f'{year}-{MONTHS[match.group(1).lower()]:02d}'
+    return label
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("the columnar store requires pyarrow, install by: pip install pyarrow")
+
+def write_table(store_path, table, df):
+    ## writes df into store_path/table, partitions of the countries/elections in df are replaced, all others stay
+    require_pyarrow()
+    if df.empty:
+        return
+    pq.write_to_dataset(pa.Table.from_pandas(df, preserve_index=False), os.path.join(store_path, table),
+                        partition_cols=['country', 'election'], existing_data_behavior='delete_matching')
+
+def read_store(store_path, table, filters=None, columns=None):
+    '''reads one table of the store as dataframe'''
+    ## filters: pyarrow filters, i.e. [('country','=','germany'),('election','>=','1990-01')], only matching partitions are read
+    require_pyarrow()
+    df = pd.read_parquet(os.path.join(store_path, table), filters=filters, columns=columns)
+    for column in ('country', 'election'): # partition columns come back as categoricals
+        if column in df and isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(str)
+    return df
+
+def parties_table(country, parties_in_year, seats_in_year):
+    rows = [(country, normalize_election_date(year), i, party, int(seats_in_year[year][i]))
+            for year, parties in parties_in_year.items() for i, party in enumerate(parties)]
+    return pd.DataFrame(rows, columns=['country', 'election', 'party_index', 'party', 'seats']).astype({'party_index': 'int16', 'seats': 'int64'})
+
+def coalitions_table(country, coalition_seats, winning_coalitions):
+    ## full 2^n tables straight from the bitmask arrays, the index is the mask
+    frames = [pd.DataFrame({'country': country, 'election': normalize_election_date(year), 'mask': np.arange(len(seats), dtype=np.int64),
+                            'seats': np.asarray(seats, dtype=np.int64), 'winning': np.asarray(winning_coalitions[year], dtype=bool)})
+              for year, seats in coalition_seats.items()]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['country', 'election', 'mask', 'seats', 'winning'])
+
+def masks_table(country, masks_in_year, parties_in_year):
+    ## min_win_masks/max_lose_masks with the coalition names
+    rows = [(country, normalize_election_date(year), int(mask), mask_to_coal(mask, parties_in_year[year]))
+            for year, masks in masks_in_year.items() for mask in masks]
+    return pd.DataFrame(rows, columns=['country', 'election', 'mask', 'coalition']).astype({'mask': 'int64'})
+
+def weights_table(country, alternative_weights, parties_in_year):
+    ## every representation of every year, representation 0 is the one of the tuples in optimal_seats
+    rows = []
+    for year, representations in alternative_weights.items():
+        representations = [representations] if isinstance(representations, np.ndarray) else representations
+        for k, weights in enumerate(representations):
+            rows.extend((country, normalize_election_date(year), k, i, party, int(round(weights[i]))) for i, party in enumerate(parties_in_year[year]))
+    return pd.DataFrame(rows, columns=['country', 'election', 'representation', 'party_index', 'party', 'weight']).astype(
+        {'representation': 'int32', 'party_index': 'int16', 'weight': 'int64'})
+
+def power_indices_table(country, power_indices_long):
+    ## long table of get_power_indices_batched with store column names
+    df = power_indices_long.rename(columns={'Year': 'election', 'Representation': 'representation', 'Party': 'party', 'Weight': 'weight',
+                                            'Penrose-Banzhaf': 'penrose_banzhaf', 'Shapely-Shubik': 'shapley_shubik', 'Minimal-Sum': 'minimal_sum',
+                                            'Mode': 'mode', 'PB error': 'pb_error', 'SS error': 'ss_error'})
+    df['election'] = df['election'].map(normalize_election_date)
+    df.insert(0, 'country', country)
+    df = df.astype({'representation': 'int32', 'weight': 'int64', 'penrose_banzhaf': 'float64', 'shapley_shubik': 'float64', 'minimal_sum': 'float64'})
+    return df.astype({column: 'float64' for column in ('pb_error', 'ss_error') if column in df})
+
+######## Manifest of completed elections #############
+
+def year_hashes(transformed_dataframe, variant=''):
+    ## sha256 of every (YearMonth, party, seats) group of transform_and_sort_dataframe, dict with (year, hash)
+    ## variant: settings changing the stored results (quota, enumeration mode, ...), part of the hash
+    return {year: hashlib.sha256((variant + '|' + group[['Party', '# of Seats']].to_csv(index=False, header=False)).encode()).hexdigest()
+            for year, group in transformed_dataframe.groupby('YearMonth', sort=True)}
+
+def manifest_file(store_path, country):
+    return os.path.join(store_path, 'manifest', f'{country}.json')
+
+def load_year_manifest(store_path, country):
+    ## dict with (election, {'year': YearMonth label, 'hash': ..., 'completed': time}), empty for new countries
+    path = manifest_file(store_path, country)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+def save_year_manifest(store_path, country, manifest):
+    ## temporary file first, an interrupted run never leaves a broken manifest
+    path = manifest_file(store_path, country)
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+def changed_years(hashes, manifest):
+    ## years without a completed result of the same hash, and the elections of the manifest which are not in the data anymore
+    changed = [year for year, value in hashes.items() if manifest.get(normalize_election_date(year), {}).get('hash') != value]
+    elections = {normalize_election_date(year) for year in hashes}
+    return changed, [election for election in manifest if election not in elections]
+
+def mark_completed(manifest, hashes, years, checks=None):
+    ## checks: dict with (year, dict of json values), the errors and crit_cases of the year, merge_stored_years restores them
+    for year in years:
+        manifest[normalize_election_date(year)] = {'year': year, 'hash': hashes[year], 'completed': time.time(), **(checks or {}).get(year, {})}
+    return manifest
+
+def stored_elections(store_path, country):
+    ## elections of the country with a partition in any table
+    elections = set()
+    for table in TABLES:
+        folder = os.path.join(store_path, table, f'country={country}')
+        if os.path.exists(folder):
+            elections |= {name[len('election='):] for name in os.listdir(folder) if name.startswith('election=')}
+    return sorted(elections)
+
+def delete_elections(store_path, country, elections):
+    ## drops the partitions of the given elections from every table
+    for table in TABLES:
+        for election in elections:
+            folder = os.path.join(store_path, table, f'country={country}', f'election={election}')
+            if os.path.exists(folder):
+                shutil.rmtree(folder)
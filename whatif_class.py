@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+from power_indice_functions import *
+
+## what-if questions on one parliament: seat changes, merges, entries/exits and quota shifts
+## built on the full count table of power_indice_functions, every scenario only adds/removes the changed players from the table
+## scenarios are new objects, the base parliament stays untouched --> thousands of queries can start from the same object
+
+class whatIfPower:
+    def __init__(self, weights, parties=None, quota=None, table=None, share=0.5):
+        ## weights: list/array of integer weights (seats or minimal weights) or dict (party, weight)
+        ## quota: winning weight, more than share of sum(weights) if None (strict majority sum(weights)//2+1 for share 1/2)
+        ## share: quota rule kept by the scenarios, i.e. the quota moves with the total after seat changes
+        ## table: full count table of these weights, only passed internally by the scenario methods
+        if isinstance(weights, dict):
+            parties, weights = list(weights.keys()), list(weights.values())
+        self.parties = list(parties) if parties is not None else list(range(len(weights)))
+        self.weights = np.array(weights, dtype=np.int64)
+        self.Q = int(self.weights.sum())
+        self.share = share
+        self.quota = quota if quota is not None else quota_from_share(self.Q, share)
+        self.table = table if table is not None else full_count_table(self.weights)
+
+    ######## Power Indices #############
+
+    def index_of(self, party):
+        ## pb and ss of one party, O(Q*n)
+        i = self.parties.index(party)
+        others = remove_player_from_table(self.table, int(self.weights[i]))
+        return power_of_player(others, int(self.weights[i]), self.quota, len(self.parties))
+
+    def power_indices(self):
+        ## dataframe like power_indices_year (Minimal-Sum is the weight share)
+        pb_list, ss_list = power_from_table(self.table, self.weights, self.quota)
+        return pd.DataFrame({'Party': self.parties, 'Penrose-Banzhaf': pb_list, 'Shapely-Shubik': ss_list,
+                             'Minimal-Sum': self.weights / self.Q if self.Q > 0 else np.zeros(len(self.parties))})
+
+    ######## Scenarios #############
+
+    def change_seats(self, party, k):
+        '''party gains k seats (loses for k<0), quota moves with the new total'''
+        i = self.parties.index(party)
+        new_weight = int(self.weights[i]) + k
+        if new_weight < 0:
+            raise ValueError(f"{party} has only {self.weights[i]} seats")
+        table = add_player_to_table(remove_player_from_table(self.table, int(self.weights[i])), new_weight)
+        weights = self.weights.copy()
+        weights[i] = new_weight
+        return whatIfPower(weights, self.parties, quota_from_share(int(weights.sum()), self.share), table, self.share)
+
+    def merge(self, party_a, party_b, name=None):
+        '''party_a and party_b become one party with their joint seats, at the position of party_a'''
+        i, j = self.parties.index(party_a), self.parties.index(party_b)
+        table = remove_player_from_table(remove_player_from_table(self.table, int(self.weights[i])), int(self.weights[j]))
+        table = add_player_to_table(table, int(self.weights[i] + self.weights[j]))
+        weights = self.weights.copy()
+        weights[i] += weights[j]
+        parties = list(self.parties)
+        parties[i] = name if name is not None else f'{party_a}+{party_b}'
+        return whatIfPower(np.delete(weights, j), parties[:j] + parties[j + 1:], self.quota, table, self.share)
+
+    def remove(self, party):
+        '''party leaves the parliament, quota moves with the new total'''
+        i = self.parties.index(party)
+        table = remove_player_from_table(self.table, int(self.weights[i]))
+        weights = np.delete(self.weights, i)
+        return whatIfPower(weights, self.parties[:i] + self.parties[i + 1:], quota_from_share(int(weights.sum()), self.share), table, self.share)
+
+    def add(self, party, weight):
+        '''new party with the given seats, quota moves with the new total'''
+        table = add_player_to_table(self.table, int(weight))
+        weights = np.append(self.weights, int(weight))
+        return whatIfPower(weights, self.parties + [party], quota_from_share(int(weights.sum()), self.share), table, self.share)
+
+    def with_quota(self, quota=None, share=None):
+        '''same parliament, other quota (absolute weight or share of the total), the table is reused as it is'''
+        share = share if share is not None else self.share
+        quota = quota if quota is not None else quota_from_share(self.Q, share)
+        return whatIfPower(self.weights, self.parties, quota, self.table, share)